@@ -1,13 +1,13 @@
 import os
 import streamlit as st
 from PIL import Image
-from segment import ImageSegmenter  # Import your segmentation module
-from object_extractor import ObjectExtractor  # Import the extraction module
-from object_identifier import ObjectIdentifier  # Import object identification module
-from text_extractor import TextExtractor  # Import the text extractor module
-from attribute_summary import AttributeSummarizer  # Import the attribute summarizer module
-from data_mapping import DataMapper  # Import the data mapping module
+from model_registry import get_registry  # Shared, load-once models for every session
+from object_extractor import ObjectExtractor, strip_images  # Import the extraction module
+from crop_dedup import CropDeduplicator  # Groups near-identical crops so they are identified and read once
+from post_processing import PostProcessor  # Fused attribute summarization and data mapping
 from output_generation import OutputGenerator  # Import the output generation module
+from instrumentation import metrics  # Per-stage timing and memory records
+from image_encoding import DEFAULT_ENCODINGS, preview_image  # Artefact file formats and display-sized copies
 import json
 import time
 
@@ -15,6 +15,34 @@ import time
 base_output_dir = 'output'
 if not os.path.exists(base_output_dir):
     os.makedirs(base_output_dir)
+
+# Images are sent to the browser downscaled; the full-resolution files stay on disk
+PREVIEW_SIZE = 1024
+THUMBNAIL_SIZE = 256
+
+# Start loading the models as soon as the server imports this script; later reruns reuse them
+registry = get_registry()
+registry.warm_up(background=True)
+
+# One extractor per server process, shared by every session and rerun: it owns the metadata store's SQLite
+# connection and the crop-writer thread
+@st.cache_resource
+def get_extractor():
+    return ObjectExtractor(output_dir='extracted_objects', metadata_dir='metadata')
+
+# Sidebar panel listing wall time, CPU time, peak memory and object counts per stage
+def show_stage_timings(stage_records):
+    st.sidebar.header("Stage Timings")
+    rows = [{
+        'Stage': record['stage'],
+        'Wall (s)': record['wall_s'],
+        'CPU (s)': record['cpu_s'],
+        'Peak RSS (MB)': record['peak_rss_mb'],
+        'Objects': record['objects'],
+    } for record in stage_records]
+    st.sidebar.table(rows)
+    st.sidebar.write(f"Total wall time: {sum(record['wall_s'] for record in stage_records):.2f}s")
+
 def main():
     # Helper function to create subdirectories for each functionality
     def create_subdirectory(function_name):
@@ -23,124 +51,167 @@ def main():
             os.makedirs(subdir)
         return subdir
 
-    # Initialize the modules
-    segmenter = ImageSegmenter()
-    extractor = ObjectExtractor(output_dir='extracted_objects', metadata_dir='metadata')
-    identifier = ObjectIdentifier()
-    text_extractor = TextExtractor()
-    summarizer = AttributeSummarizer()
-    data_mapper = DataMapper()
+    # Initialize the lightweight modules; the extractor and the heavy models are shared by the whole process
+    extractor = get_extractor()
+    post_processor = PostProcessor()
+    deduplicator = CropDeduplicator()
 
     # Streamlit app UI with step headings
     st.title("Image Segmentation, Extraction, and Identification Pipeline")
+    show_timings = st.sidebar.checkbox("Show stage timings")
 
     # Step 1: Upload Image
     st.header("Step 1: Upload Image")
     uploaded_file = st.file_uploader("Upload an image", type=['jpg', 'jpeg', 'png'])
 
     if uploaded_file is not None:
-        # Load the image and display it
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Image", use_column_width=True)
-        
-        # Step 2: Segment the image
-        st.header("Step 2: Segment the Image")
-        st.write("Segmenting the image...")
-
-        segmentation_dir = create_subdirectory('segmentation')
-        original_image, segmented_image, masks, boxes, labels = segmenter.process_image(image)
-
-        # Save the segmented image
-        segmented_image_path = os.path.join(segmentation_dir, 'segmented_image.png')
-        segmented_image.save(segmented_image_path)
-        st.image(segmented_image, caption="Segmented Image", use_column_width=True)
-
-        # Step 3: Extract objects from the image
-        st.header("Step 3: Extract Objects from the Image")
-        st.write("Extracting objects from the segmented image...")
-
-        #extraction_dir = create_subdirectory('extraction')
-        master_id, extracted_objects = extractor.extract_objects(original_image, masks, boxes, labels)
-
-        # Display extracted objects
-        st.write(f"Number of objects extracted: {len(extracted_objects)}")
-        for obj in extracted_objects:
-            st.image(obj['file_path'], caption=f"Object ID: {obj['id']}")
-        
-        # Step 4: Identify Objects
-        st.header("Step 4: Identify Objects")
-        st.write("Identifying objects using YOLOv5 model...")
-
-        identification_dir = create_subdirectory('identification')
-        identified_objects = identifier.identify_objects(extracted_objects)
+        # Record per-stage timings for this run only
+        with metrics.collect() as stage_records:
+            # Load the image and display it
+            image = Image.open(uploaded_file)
+            st.image(preview_image(image, PREVIEW_SIZE), caption="Uploaded Image", use_column_width=True,
+                     output_format='JPEG')
+
+            # Models are loaded once per process; only the first request waits for them
+            with st.spinner("Loading models..."):
+                segmenter = registry.get_segmenter()
+                identifier = registry.get_identifier()
+                text_extractor = registry.get_text_extractor()
         
-        identified_objects_file = os.path.join(identification_dir, 'identified_objects.json')
-        with open(identified_objects_file, 'w') as f:
-            json.dump(identified_objects, f, indent=4)
-        st.write(f"Identified objects have been saved to {identified_objects_file}.")
-
-        # Display identified objects with confidence > 0.7
-        filtered_objects = [obj for obj in identified_objects if max(obj['confidences']) > 0.7]
-        if filtered_objects:
-            for obj in filtered_objects:
-                st.write(f"**Object ID**: {obj['id']}")
-                st.write(f"**Labels**: {', '.join(obj['labels'])}")
-                st.write(f"**Confidence Scores**: {', '.join([str(c) for c in obj['confidences']])}")
-                st.image(obj['file_path'], caption=f"Object ID: {obj['id']} with Labels: {', '.join(obj['labels'])}")
-        else:
-            st.write("No identified objects with confidence greater than 0.7.")
-
-        # Step 5: Extract text from the identified objects
-        st.header("Step 5: Extract Text from Objects")
-        st.write("Extracting text from the identified objects...")
-
-        text_extraction_dir = create_subdirectory('text_extraction')
-        extracted_text_data = text_extractor.extract_from_objects(identified_objects)
-        extracted_text_file = os.path.join(text_extraction_dir, 'extracted_text.json')
-        text_extractor.save_extracted_text(extracted_text_data, extracted_text_file)
-        st.write(f"Extracted text has been saved to {extracted_text_file}.")
+            # Step 2: Segment the image
+            st.header("Step 2: Segment the Image")
+            st.write("Segmenting the image...")
+
+            segmentation_dir = create_subdirectory('segmentation')
+            original_image, segmented_image, masks, boxes, labels = segmenter.process_image(image)
+
+            # Save the segmented image
+            segmented_image_path = DEFAULT_ENCODINGS['segmentation'].save(
+                segmented_image, os.path.join(segmentation_dir, 'segmented_image'))
+            st.image(preview_image(segmented_image, PREVIEW_SIZE), caption="Segmented Image", use_column_width=True,
+                     output_format='JPEG')
+
+            # Step 3: Extract objects from the image
+            st.header("Step 3: Extract Objects from the Image")
+            st.write("Extracting objects from the segmented image...")
+
+            #extraction_dir = create_subdirectory('extraction')
+            # Display each extracted object as soon as it is cropped
+            st.write(f"Number of objects extracted: {len(boxes)}")
+            extracted_objects = []
+            for obj in extractor.iter_extract_objects(original_image, masks, boxes, labels):
+                extracted_objects.append(obj)
+                st.image(preview_image(obj['image'], THUMBNAIL_SIZE), caption=f"Object ID: {obj['id']}")
+            extractor.flush()  # Surface any crop that failed to be written
+
+            # Identification and OCR run once per group of near-identical crops
+            representatives, duplicate_groups = deduplicator.deduplicate(extracted_objects, masks)
+            if len(representatives) < len(extracted_objects):
+                st.write(f"{len(extracted_objects)} objects grouped into {len(representatives)} distinct crops.")
         
-        # Step 6: Summarize attributes of objects
-        st.header("Step 6: Summarize Object Attributes")
-        st.write("Summarizing object attributes...")
-
-        attribute_summary_dir = create_subdirectory('attribute_summary')
-        summarizer.load_data()
-        summarized_attributes = summarizer.summarize_attributes()
-
-        summarized_attributes_file = os.path.join(attribute_summary_dir, 'summarized_attributes.json')
-        summarizer.save_summary(summarized_attributes, output_file=summarized_attributes_file)
-        st.write(f"Summarized attributes have been saved to {summarized_attributes_file}.")
-
-        # Step 7: Map all extracted data to each object and the master input image
-        st.header("Step 7: Map Data to Each Object")
-        st.write("Mapping data to each object...")
-
-        data_mapping_dir = create_subdirectory('data_mapping')
-        data_mapper.load_data()
-        mapped_output_file = os.path.join(data_mapping_dir, 'mapped_data.json')
-        data_mapper.save_mapped_data(output_file=mapped_output_file)
-        st.write(f"Mapped data has been save {mapped_output_file}")
-
-                 # Step 8: Generate Final Output (Image with Annotations and Data Table)
-        st.header("Step 8: Generate Final Output")
-        st.write("Generating the final output with annotations and data table...")
+            # Step 4: Identify Objects
+            st.header("Step 4: Identify Objects")
+            st.write("Identifying objects using YOLOv5 model...")
+
+            identification_dir = create_subdirectory('identification')
+            identified_representatives = []
+            identified_objects = []
+
+            # Display identified objects with confidence > 0.7 batch by batch, as each forward pass finishes
+            for representative in identifier.iter_identify_objects(representatives):
+                identified_representatives.append(representative)
+                group = deduplicator.fan_out([representative], duplicate_groups)
+                identified_objects.extend(group)
+                for obj in group:
+                    if max(obj['confidences']) <= 0.7:
+                        continue
+                    st.write(f"**Object ID**: {obj['id']}")
+                    st.write(f"**Labels**: {', '.join(obj['labels'])}")
+                    st.write(f"**Confidence Scores**: {', '.join([str(c) for c in obj['confidences']])}")
+                    st.image(preview_image(obj['image'], THUMBNAIL_SIZE),
+                             caption=f"Object ID: {obj['id']} with Labels: {', '.join(obj['labels'])}")
+            if not any(max(obj['confidences']) > 0.7 for obj in identified_objects):
+                st.write("No identified objects with confidence greater than 0.7.")
+
+            identified_objects_file = os.path.join(identification_dir, 'identified_objects.json')
+            with open(identified_objects_file, 'w') as f:
+                json.dump(strip_images(identified_objects), f, indent=4)
+            st.write(f"Identified objects have been saved to {identified_objects_file}.")
+
+            # Step 5: Extract text from the identified objects
+            st.header("Step 5: Extract Text from Objects")
+            st.write("Extracting text from the identified objects...")
+
+            text_extraction_dir = create_subdirectory('text_extraction')
+            # Show the text found in each object as its chunk of crops is read
+            extracted_text_data = []
+            for text in text_extractor.iter_extract_from_objects(identified_representatives):
+                group = deduplicator.fan_out([text], duplicate_groups)
+                extracted_text_data.extend(group)
+                if text['extracted_text']:
+                    st.write(f"**{', '.join(item['id'] for item in group)}**: {text['extracted_text']}")
+            if text_extractor.last_stats.get('skipped_no_text'):
+                st.write(f"{text_extractor.last_stats['skipped_no_text']} crops were skipped as text-free "
+                         f"without running OCR.")
+            extracted_text_file = os.path.join(text_extraction_dir, 'extracted_text.json')
+            text_extractor.save_extracted_text(extracted_text_data, extracted_text_file)
+            st.write(f"Extracted text has been saved to {extracted_text_file}.")
         
-        output_generation_dir = create_subdirectory('output_generation')
+            # Step 6: Summarize attributes of objects
+            st.header("Step 6: Summarize Object Attributes")
+            st.write("Summarizing object attributes...")
+
+            # Summaries and mapping are computed together from the in-memory results of the earlier steps
+            attribute_summary_dir = create_subdirectory('attribute_summary')
+            summarized_attributes, mapped_data = post_processor.process(extracted_objects, identified_objects,
+                                                                        extracted_text_data)
+
+            summarized_attributes_file = os.path.join(attribute_summary_dir, 'summarized_attributes.json')
+            post_processor.save(summarized_attributes, mapped_data, summary_file=summarized_attributes_file)
+            st.write(f"Summarized attributes have been saved to {summarized_attributes_file}.")
+
+            # Step 7: Map all extracted data to each object and the master input image
+            st.header("Step 7: Map Data to Each Object")
+            st.write("Mapping data to each object...")
+
+            data_mapping_dir = create_subdirectory('data_mapping')
+            mapped_output_file = os.path.join(data_mapping_dir, 'mapped_data.json')
+            post_processor.save(summarized_attributes, mapped_data, mapped_file=mapped_output_file)
+            st.write(f"Mapped data has been save {mapped_output_file}")
+
+                     # Step 8: Generate Final Output (Image with Annotations and Data Table)
+            st.header("Step 8: Generate Final Output")
+            st.write("Generating the final output with annotations and data table...")
         
-        # Path to the original image (in the correct format for the output generation)
-        original_image_path = uploaded_file
+            output_generation_dir = create_subdirectory('output_generation')
         
-        # Initialize and run the output generator
-        output_generator = OutputGenerator(original_image_path)
-        output_generator.load_mapped_data()
+            # Initialize and run the output generator on the decoded image and the mapped data from Step 7
+            output_generator = OutputGenerator(original_image, mapped_data=mapped_data)
         
-        final_output_file = os.path.join(output_generation_dir, 'final_output_with_table.png')
-        output_generator.generate_final_output(final_output_file)
+            final_output_encoding = DEFAULT_ENCODINGS['final_output']
+            table_export_file = os.path.join(output_generation_dir, 'final_table.csv')
+            final_output = output_generator.generate_final_output(
+                os.path.join(output_generation_dir, 'final_output_with_table'),
+                table_file=os.path.join(output_generation_dir, 'final_table'), export_files=[table_export_file],
+                encoding=final_output_encoding, table_encoding=DEFAULT_ENCODINGS['table'])
+            final_output_file = output_generator.output_image_file
         
-        # Display the final output
-        st.image(final_output_file, caption="Final Output: Annotated Image with Data Table", use_column_width=True)
-        st.write(f"Final output has been saved to {final_output_file}.")
-    
+            # Display a downscaled preview; the full-resolution file is available for download
+            st.image(preview_image(final_output, PREVIEW_SIZE), caption="Final Output: Annotated Image with Data Table",
+                     use_column_width=True, output_format='JPEG')
+            st.write(f"Final output has been saved to {final_output_file}.")
+            with open(final_output_file, 'rb') as f:
+                st.download_button("Download full-resolution output", f.read(),
+                                   file_name=os.path.basename(final_output_file),
+                                   mime=f"image/{final_output_encoding.for_image(final_output).format.lower()}")
+
+            # The image shows the first page of the table; the CSV holds every row
+            with open(table_export_file, 'rb') as f:
+                st.download_button("Download table (CSV)", f.read(), file_name='final_table.csv', mime='text/csv')
+
+        if show_timings:
+            show_stage_timings(stage_records)
+
+
 if __name__ == '__main__':
     main()
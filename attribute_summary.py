@@ -1,9 +1,20 @@
 import json
+from keyword_rules import DEFAULT_RULES_FILE, load_rules
+from instrumentation import instrument
 
 class AttributeSummarizer:
-    def __init__(self, extracted_text_file='extracted_text.json', identified_objects_file='identified_objects.json'):
+    def __init__(self, extracted_text_file='extracted_text.json', identified_objects_file='identified_objects.json',
+                 rules_file=DEFAULT_RULES_FILE):
         self.extracted_text_file = extracted_text_file
         self.identified_objects_file = identified_objects_file
+        self.rules_file = rules_file
+        load_rules(rules_file)  # Compile now so a missing or invalid rules file fails at construction
+
+    # Label descriptions and keyword categories, compiled once per version of the rules file so edits apply
+    # to a long-running process
+    @property
+    def rules(self):
+        return load_rules(self.rules_file)
 
     def load_data(self):
         with open(self.extracted_text_file, 'r') as f:
@@ -12,46 +23,46 @@ class AttributeSummarizer:
         with open(self.identified_objects_file, 'r') as f:
             self.identified_objects = json.load(f)
 
-    def summarize_attributes(self):
-        summary = []
+    # Summarize the loaded data, or the in-memory results passed in directly
+    @instrument('summarize_attributes', objects=len)
+    def summarize_attributes(self, identified_objects=None, extracted_data=None):
+        if identified_objects is None:
+            identified_objects = self.identified_objects
+        if extracted_data is None:
+            extracted_data = self.extracted_data
 
         # Create a mapping of object ID to extracted text
-        text_mapping = {item['id']: item['extracted_text'] for item in self.extracted_data}
-
-        for obj in self.identified_objects:
-            obj_id = obj['id']
-            file_path = obj['file_path']
-            extracted_text = text_mapping.get(obj_id, "No text extracted")
+        text_mapping = {item['id']: item['extracted_text'] for item in extracted_data}
 
-            # Ensure label is a single value
-            label = obj['labels']
-            if isinstance(label, list):
-                label = label[0]  # Take the first label if it's a list
+        return self.summarize_objects(identified_objects,
+                                      [text_mapping.get(obj['id'], "No text extracted") for obj in identified_objects])
 
-            # Generate a detailed summary
-            summary_entry = {
-                'id': obj_id,
-                'file_path': file_path,
-                'label': label,
-                'extracted_text': extracted_text,
-                'summary': self.generate_summary(extracted_text, label)
-            }
-            summary.append(summary_entry)
+    # Summarize a batch of objects, classifying all of their texts in one pass
+    def summarize_objects(self, objects, extracted_texts):
+        key_attributes = self.rules.key_attributes_many(extracted_texts)
+        return [self.summarize_object(obj, text, attributes)
+                for obj, text, attributes in zip(objects, extracted_texts, key_attributes)]
 
-        return summary
+    def summarize_object(self, obj, extracted_text, key_attributes=None):
+        # Ensure label is a single value
+        label = obj['labels']
+        if isinstance(label, list):
+            label = label[0]  # Take the first label if it's a list
 
-    def generate_summary(self, extracted_text, label):
-        # Mapping of labels to descriptive terms
-        label_descriptions = {
-            1: "Airplane",
-            2: "Discount Announcement",
-            3: "Flight Details",
-            # Add more mappings as needed
+        # Generate a detailed summary
+        return {
+            'id': obj['id'],
+            'file_path': obj.get('file_path'),
+            'label': label,
+            'extracted_text': extracted_text,
+            'summary': self.generate_summary(extracted_text, label, key_attributes)
         }
 
-        # Construct the summary
-        description = label_descriptions.get(label, "Unknown Object")
-        key_attributes = self.extract_key_attributes(extracted_text)
+    def generate_summary(self, extracted_text, label, key_attributes=None):
+        # Describe the YOLO class name using the configured label descriptions
+        description = self.rules.describe(label)
+        if key_attributes is None:
+            key_attributes = self.extract_key_attributes(extracted_text)
 
         summary = (
             f"Object ID: {description}\n"
@@ -63,16 +74,8 @@ class AttributeSummarizer:
         return summary
 
     def extract_key_attributes(self, extracted_text):
-        # Extract meaningful attributes from the text
-        # This is a placeholder; implement your own logic as needed
-        if "airplane" in extracted_text.lower():
-            return "Type: Commercial, Features: Advanced Technology"
-        elif "discount" in extracted_text.lower():
-            return "Type: Promotion, Features: Limited Time Offer"
-        elif "flight" in extracted_text.lower():
-            return "Type: Flight Information, Features: Departure and Arrival Details"
-        else:
-            return "General Information"
+        # Attributes of the highest-priority keyword category found in the text
+        return self.rules.key_attributes(extracted_text)
 
     def save_summary(self, summary, output_file='summarized_attributes.json'):
         with open(output_file, 'w') as f:
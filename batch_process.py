@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from image_encoding import DEFAULT_ENCODINGS, ImageEncoding
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+# Pipeline owned by each worker process, created once by init_worker
+_worker_pipeline = None
+
+
+# Collect image paths from a directory, or from a manifest (.txt with one path per line, or a .json list)
+def collect_images(source, recursive=False):
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+            if not recursive:
+                break
+        return sorted(paths)
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, 'r') as f:
+        if source.endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    # Relative manifest entries are resolved against the manifest's own directory
+    return [entry if os.path.isabs(entry) else os.path.join(base_dir, entry) for entry in entries]
+
+
+# argparse type for --encoding: ARTEFACT=FORMAT[:LEVEL[:METHOD]] to an (artefact, ImageEncoding) pair
+def encoding_option(value):
+    artefact, separator, spec = value.partition('=')
+    if not separator:
+        raise argparse.ArgumentTypeError(f"expected ARTEFACT=FORMAT[:LEVEL[:METHOD]], got '{value}'")
+    if artefact not in DEFAULT_ENCODINGS:
+        raise argparse.ArgumentTypeError(f"unknown image artefact '{artefact}'; choose one of "
+                                         f"{', '.join(DEFAULT_ENCODINGS)}")
+    try:
+        return artefact, ImageEncoding.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def build_pipeline(args):
+    from model_registry import ModelRegistry
+    from pipeline import Pipeline
+    from result_cache import ResultCache
+
+    cache = ResultCache(args.cache_dir or None)
+    options = {
+        'segmenter': {'backend': args.segmenter_backend, 'artefact_dir': args.artefact_dir,
+                      'resolution': args.resolution, 'max_size': args.max_size, 'tile_size': args.tile_size},
+        'identifier': {'backend': args.identifier_backend, 'artefact_dir': args.artefact_dir},
+        'text_extractor': {'mode': args.ocr_mode, 'artefact_dir': args.artefact_dir},
+    }
+    registry = ModelRegistry(cache=cache, options=options)
+    encodings = dict(args.encoding or [])
+    # --force recomputes every stage instead of reusing the ones whose fingerprint is unchanged
+    return Pipeline(registry=registry, output_root=args.output, metadata_dir=args.metadata_dir,
+                    incremental=not args.force, encodings=encodings)
+
+
+def init_worker(args, threads_per_worker):
+    global _worker_pipeline
+    import torch
+    torch.set_num_threads(threads_per_worker)  # Share the cores between the worker processes
+    _worker_pipeline = build_pipeline(args)
+
+
+def process_in_worker(image_path, master_id):
+    return _worker_pipeline.summarize(_worker_pipeline.process(image_path, master_id))
+
+
+def report(done, total, summary, started):
+    elapsed = time.perf_counter() - started
+    throughput = done / elapsed if elapsed else 0.0
+    seconds = sum(summary['timings'].values())
+    print(f"[{done}/{total}] {summary['source']} -> {summary['master_id']} "
+          f"({summary['objects']} objects, {seconds:.1f}s) | {throughput:.2f} images/s", flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the segmentation, identification and OCR pipeline over many images.")
+    parser.add_argument('source', help="Directory of images, or a manifest (.txt with one path per line, or .json list)")
+    parser.add_argument('--output', default='output', help="Root directory for per-image outputs (output/<master_id>/)")
+    parser.add_argument('--metadata-dir', default='metadata', help="Directory holding the object metadata store")
+    parser.add_argument('--cache-dir', default='cache', help="Result cache directory; empty for an in-memory cache only")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes")
+    parser.add_argument('--ocr-mode', default='sequential', choices=('sequential', 'batched'),
+                        help="OCR mode used inside each worker")
+    parser.add_argument('--segmenter-backend', default='eager', choices=('eager', 'quantized', 'torchscript'),
+                        help="Mask R-CNN inference backend; the optimised ones run on CPU")
+    parser.add_argument('--identifier-backend', default='eager', choices=('eager', 'torchscript'),
+                        help="YOLOv5 inference backend; the optimised one runs on CPU")
+    parser.add_argument('--artefact-dir', help="Directory holding the model weights and converted models "
+                                               "(default: $PIPELINE_ARTEFACT_DIR or models/)")
+    parser.add_argument('--resolution', default='full', choices=('full', 'downscale', 'tiled'),
+                        help="Segment large images as they are, downscaled to --max-size, or as overlapping tiles")
+    parser.add_argument('--max-size', type=int, default=1333, help="Longest side in downscale mode")
+    parser.add_argument('--tile-size', type=int, default=1024, help="Tile side in tiled mode")
+    parser.add_argument('--encoding', action='append', type=encoding_option,
+                        metavar='ARTEFACT=FORMAT[:LEVEL[:METHOD]]',
+                        help="Image encoding for crop, segmentation, final_output or table files, e.g. "
+                             "final_output=jpeg:85 or crop=png:0; repeat for several artefacts")
+    parser.add_argument('--pipelined', action='store_true',
+                        help="Run the stages concurrently in one process, connected by bounded queues")
+    parser.add_argument('--queue-size', type=int, default=2, help="Images buffered between stages when pipelined")
+    parser.add_argument('--ocr-threads', type=int, default=1, help="OCR threads when pipelined")
+    parser.add_argument('--recursive', action='store_true', help="Also collect images from subdirectories")
+    parser.add_argument('--force', action='store_true',
+                        help="Reprocess every image from scratch, even those already finished")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from pipeline import master_id_for
+
+    images = collect_images(args.source, recursive=args.recursive)
+    if not images:
+        print(f"No images found in {args.source}.")
+        return 0
+
+    # Skip images finished with the current settings, so a restarted run picks up where it stopped. Images
+    # finished with other settings are rerun, reusing the stages the change doesn't affect.
+    pipeline = build_pipeline(args)
+    jobs = []
+    for image_path in images:
+        master_id = master_id_for(image_path)
+        if not args.force and pipeline.is_done(master_id, image_path):
+            continue
+        jobs.append((image_path, master_id))
+    mode = 'pipelined stages' if args.pipelined else f"{args.workers} worker(s)"
+    print(f"{len(images)} images found, {len(images) - len(jobs)} already done, {len(jobs)} to process "
+          f"with {mode}.")
+
+    failures = []
+    started = time.perf_counter()
+    if args.pipelined:
+        from pipeline_scheduler import PipelineScheduler
+        # Segmentation of image N+1 overlaps identification, OCR and rendering of the images before it
+        scheduler = PipelineScheduler(pipeline, queue_size=args.queue_size,
+                                      workers_per_group={'ocr': args.ocr_threads})
+        for done, summary in enumerate(scheduler.run(jobs), start=1):
+            if 'error' in summary:
+                print(f"Failed to process {summary['source']}: {summary['error']}", file=sys.stderr)
+                failures.append(summary['source'])
+                continue
+            report(done, len(jobs), summary, started)
+    elif args.workers <= 1:
+        for done, (image_path, master_id) in enumerate(jobs, start=1):
+            try:
+                summary = pipeline.summarize(pipeline.process(image_path, master_id))
+            except Exception as e:
+                print(f"Failed to process {image_path}: {e}", file=sys.stderr)
+                failures.append(image_path)
+                continue
+            report(done, len(jobs), summary, started)
+    else:
+        threads_per_worker = max(1, (os.cpu_count() or 1) // args.workers)
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                                 initargs=(args, threads_per_worker)) as pool:
+            futures = {pool.submit(process_in_worker, image_path, master_id): image_path
+                       for image_path, master_id in jobs}
+            for done, future in enumerate(as_completed(futures), start=1):
+                try:
+                    summary = future.result()
+                except Exception as e:
+                    print(f"Failed to process {futures[future]}: {e}", file=sys.stderr)
+                    failures.append(futures[future])
+                    continue
+                report(done, len(jobs), summary, started)
+
+    elapsed = time.perf_counter() - started
+    processed = len(jobs) - len(failures)
+    print(f"Processed {processed} images in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} images/s); "
+          f"{len(failures)} failed.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
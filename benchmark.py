@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from types import SimpleNamespace
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+from instrumentation import metrics
+from rendering import load_font
+from image_encoding import ImageEncoding
+
+# Labels the stub detector hands out, cycling through a few YOLO class names
+STUB_CLASS_NAMES = {0: 'person', 1: 'car', 2: 'airplane', 3: 'bus', 4: 'stop sign'}
+
+
+# Deterministic rectangles for a synthetic poster; the stub segmenter "detects" exactly these
+def poster_layout(width, height, objects, seed):
+    rng = random.Random(seed)
+    boxes = []
+    for _ in range(objects):
+        box_width = rng.randint(max(8, width // 12), max(9, width // 4))
+        box_height = rng.randint(max(8, height // 12), max(9, height // 4))
+        x1 = rng.randint(0, width - box_width)
+        y1 = rng.randint(0, height - box_height)
+        boxes.append((x1, y1, x1 + box_width, y1 + box_height))
+    return boxes
+
+
+# Noisy background with coloured, captioned panels, roughly like a flyer
+def make_poster(width, height, objects, seed):
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    poster = Image.fromarray(background)
+    draw = ImageDraw.Draw(poster)
+    font = load_font(max(12, height // 40))
+    for i, (x1, y1, x2, y2) in enumerate(poster_layout(width, height, objects, seed)):
+        color = tuple(int(c) for c in rng.integers(0, 256, size=3))
+        draw.rectangle((x1, y1, x2 - 1, y2 - 1), fill=color)
+        draw.text((x1 + 4, y1 + 4), f"SALE {i} 50% OFF", fill=(255, 255, 255), font=font)
+    return poster
+
+
+class StubMaskRCNN:
+    # Stands in for Mask R-CNN: returns the poster's panels in torchvision's output format
+    def __init__(self, objects, seed):
+        self.objects = objects
+        self.seed = seed
+
+    def to(self, device):
+        return self
+
+    def eval(self):
+        return self
+
+    def __call__(self, images):
+        outputs = []
+        for tensor in images:
+            _, height, width = tensor.shape
+            boxes = poster_layout(width, height, self.objects, self.seed)
+            masks = torch.zeros((len(boxes), 1, height, width))
+            for i, (x1, y1, x2, y2) in enumerate(boxes):
+                masks[i, 0, y1:y2, x1:x2] = 0.9
+            outputs.append({
+                'masks': masks,
+                'boxes': torch.tensor(boxes, dtype=torch.float32).reshape(-1, 4),
+                'scores': torch.full((len(boxes),), 0.95),
+                'labels': torch.arange(len(boxes)) % 90 + 1,
+            })
+        return outputs
+
+
+class StubYOLO:
+    # Stands in for the YOLOv5 AutoShape model: letterboxes each crop and reports one detection
+    names = STUB_CLASS_NAMES
+
+    def __call__(self, images, size=640):
+        predictions = []
+        for image in images:
+            scale = size / max(image.size)
+            resized = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+            class_index = int(np.asarray(resized).mean()) % len(self.names)
+            predictions.append(torch.tensor([[0.0, 0.0, image.width, image.height, 0.9, class_index]]))
+        return SimpleNamespace(pred=predictions)
+
+
+class StubReader:
+    # Stands in for easyocr.Reader: converts to greyscale and returns a fixed line of text
+    def readtext(self, image):
+        np.asarray(image).mean(axis=-1)
+        return [([[0, 0], [1, 0], [1, 1], [0, 1]], 'SALE 50% OFF', 0.9)]
+
+    def readtext_batched(self, images):
+        return [self.readtext(image) for image in images]
+
+
+# Time func over warmup + repeat runs; items is the number of images or objects handled per run
+def measure(func, repeat, warmup, items):
+    for _ in range(warmup):
+        func()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    mean = statistics.mean(durations)
+    return {
+        'repeat': repeat,
+        'items': items,
+        'mean_s': round(mean, 6),
+        'median_s': round(statistics.median(durations), 6),
+        'p95_s': round(durations[min(len(durations) - 1, int(0.95 * len(durations)))], 6),
+        'min_s': round(durations[0], 6),
+        'items_per_s': round(items / mean, 3) if mean else None,
+    }
+
+
+def build_stage_objects(args, work_dir):
+    from segment import ImageSegmenter
+    from object_extractor import ObjectExtractor
+    from object_identification import ObjectIdentifier
+    from text_extractor import TextExtractor
+    from metadata_store import MetadataStore
+
+    store = MetadataStore(os.path.join(work_dir, 'metadata.db'))
+    return SimpleNamespace(
+        segmenter=ImageSegmenter(model=StubMaskRCNN(args.objects, args.seed)),
+        downscaled_segmenter=ImageSegmenter(model=StubMaskRCNN(args.objects, args.seed), resolution='downscale'),
+        tiled_segmenter=ImageSegmenter(model=StubMaskRCNN(args.objects, args.seed), resolution='tiled'),
+        extractor=ObjectExtractor(output_dir=os.path.join(work_dir, 'crops'), metadata_dir=work_dir,
+                                  save_crops=False, metadata_store=store),
+        writing_extractor=ObjectExtractor(output_dir=os.path.join(work_dir, 'crops'), metadata_dir=work_dir,
+                                          save_crops=True, background_save=False, metadata_store=store),
+        identifier=ObjectIdentifier(model=StubYOLO()),
+        text_extractor=TextExtractor(reader=StubReader()),
+        batched_text_extractor=TextExtractor(reader=StubReader(), mode='batched'),
+        store=store,
+    )
+
+
+def run_benchmarks(args):
+    from data_mapping import DataMapper
+    from post_processing import PostProcessor
+    from output_generation import OutputGenerator
+    from model_registry import ModelRegistry
+    from pipeline import Pipeline
+    from crop_dedup import CropDeduplicator
+    from result_cache import ResultCache
+
+    work_dir = tempfile.mkdtemp(prefix='pipeline-bench-')
+    results = {}
+    try:
+        stages = build_stage_objects(args, work_dir)
+        poster = make_poster(args.width, args.height, args.objects, args.seed)
+        poster_path = os.path.join(work_dir, 'poster.png')
+        poster.save(poster_path)
+
+        def bench(name, func, items):
+            results[name] = measure(func, args.repeat, args.warmup, items)
+            print(f"{name:<34} {results[name]['median_s'] * 1000:10.2f} ms  {results[name]['items_per_s']:>10} items/s")
+
+        # Intermediate results the later stages start from
+        image, masks, boxes, labels = stages.segmenter.segment_image(poster)
+        _, extracted = stages.extractor.extract_objects(image, masks, boxes, labels)
+        identified = stages.identifier.identify_objects(extracted)
+        extracted_text = stages.text_extractor.extract_from_objects(identified)
+        post_processor = PostProcessor()
+        deduplicator = CropDeduplicator()
+        summaries, mapped = post_processor.process(extracted, identified, extracted_text)
+        records = [{key: value for key, value in obj.items() if key != 'image'} for obj in extracted]
+        metadata = {record['id']: record for record in records}
+
+        # Stage classes
+        bench('stage.segment_image', lambda: stages.segmenter.segment_image(poster), 1)
+        bench('stage.segment_downscaled', lambda: stages.downscaled_segmenter.segment_image(poster), 1)
+        bench('stage.segment_tiled', lambda: stages.tiled_segmenter.segment_image(poster), 1)
+        bench('stage.segment_batch', lambda: stages.segmenter.segment_batch([poster] * args.batch),
+              args.batch)
+        bench('stage.visualize_segmentation',
+              lambda: stages.segmenter.visualize_segmentation(image, masks, boxes, labels), len(masks))
+        bench('stage.extract_objects', lambda: stages.extractor.extract_objects(image, masks, boxes, labels),
+              len(masks))
+        bench('stage.deduplicate_crops', lambda: deduplicator.deduplicate(extracted, masks), len(extracted))
+        bench('stage.identify_objects', lambda: stages.identifier.identify_objects(extracted), len(extracted))
+        bench('stage.ocr_sequential', lambda: stages.text_extractor.extract_from_objects(identified),
+              len(identified))
+        bench('stage.ocr_batched', lambda: stages.batched_text_extractor.extract_from_objects(identified),
+              len(identified))
+        # Extraction, identification and OCR chained through their generator variants
+        def streamed_chain():
+            objects = stages.extractor.iter_extract_objects(image, masks, boxes, labels)
+            return list(stages.text_extractor.iter_extract_from_objects(stages.identifier.iter_identify_objects(objects)))
+
+        bench('stage.streamed_chain', streamed_chain, len(masks))
+        bench('stage.post_process', lambda: post_processor.process(extracted, identified, extracted_text),
+              len(identified))
+
+        # I/O-only paths
+        bench('io.crop_png_writes',
+              lambda: stages.writing_extractor.extract_objects(image, masks, boxes, labels), len(masks))
+        legacy_dir = os.path.join(work_dir, 'legacy_metadata')
+        os.makedirs(legacy_dir, exist_ok=True)
+
+        def write_legacy_metadata():
+            for record in records:
+                with open(os.path.join(legacy_dir, f"{record['id']}.json"), 'w') as f:
+                    json.dump(record, f, indent=4)
+
+        bench('io.metadata_json_files', write_legacy_metadata, len(records))
+        bench('io.metadata_store_writes', lambda: stages.store.put_many(records), len(records))
+        bench('io.metadata_store_lookups', lambda: stages.store.get_many(metadata), len(records))
+        data_mapper = DataMapper(metadata_store=stages.store)
+        bench('io.data_mapper_join', lambda: data_mapper.map_data(identified, summaries, metadata), len(identified))
+        output_generator = OutputGenerator(image, mapped_data=mapped)
+        bench('io.annotate_image', lambda: output_generator.annotate_image(), len(mapped))
+        bench('io.render_table_page', lambda: output_generator.generate_table(max_pages=1), len(mapped))
+        bench('io.export_table_csv', lambda: output_generator.export_table(os.path.join(work_dir, 'final_table.csv')),
+              len(mapped))
+        bench('io.generate_final_output', lambda: output_generator.generate_final_output(
+            os.path.join(work_dir, 'final_output_with_table.png'), table_file=os.path.join(work_dir, 'final_table.png')),
+            len(mapped))
+        final_output = output_generator.generate_final_output(os.path.join(work_dir, 'final_output_with_table.png'))
+        for spec in ('png', 'png:1', 'jpeg:90', 'webp:85:0'):
+            encoding = ImageEncoding.parse(spec)
+            bench(f"io.encode_final_output_{spec.replace(':', '_')}",
+                  lambda encoding=encoding: encoding.encode(final_output), 1)
+
+        # Whole pipeline on stub models, with caching disabled so every run does the full work
+        registry = ModelRegistry(cache=ResultCache(None), options={
+            'segmenter': {'model': StubMaskRCNN(args.objects, args.seed), 'cache': None},
+            'identifier': {'model': StubYOLO(), 'cache': None},
+            'text_extractor': {'reader': StubReader(), 'cache': None},
+        })
+        pipeline = Pipeline(registry=registry, output_root=os.path.join(work_dir, 'output'),
+                            metadata_dir=os.path.join(work_dir, 'pipeline_metadata'))
+        bench('pipeline.end_to_end', lambda: pipeline.process(poster_path), 1)
+        stages.store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Print the median-latency change of every benchmark against an earlier results file
+def compare(results, baseline_file):
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)['results']
+    print(f"\nComparison with {baseline_file} (median latency, negative is faster):")
+    for name, result in results.items():
+        if name in baseline and baseline[name]['median_s']:
+            change = (result['median_s'] - baseline[name]['median_s']) / baseline[name]['median_s'] * 100
+            print(f"{name:<34} {change:+8.1f}%")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage offline on synthetic posters.")
+    parser.add_argument('--width', type=int, default=1600, help="Synthetic poster width in pixels")
+    parser.add_argument('--height', type=int, default=1200, help="Synthetic poster height in pixels")
+    parser.add_argument('--objects', type=int, default=20, help="Objects per synthetic poster")
+    parser.add_argument('--batch', type=int, default=4, help="Images per segment_batch call")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per benchmark")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help="Results file (default: benchmark_results/<commit>.json)")
+    parser.add_argument('--compare', default=None, help="Earlier results file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.metrics_file = ''  # Keep benchmark runs out of the production metrics log
+    torch.manual_seed(args.seed)
+
+    results = run_benchmarks(args)
+    commit = git_commit()
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'torch': torch.__version__,
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+        },
+        'results': results,
+    }
+
+    output_file = args.output or os.path.join('benchmark_results', f"{commit or time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Benchmark results saved to {output_file}.")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
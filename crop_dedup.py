@@ -0,0 +1,129 @@
+import numpy as np
+from PIL import Image
+from instrumentation import instrument
+
+
+# Pairwise IoU of (N, 4) boxes given as (x1, y1, x2, y2)
+def box_iou_matrix(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = areas[:, None] + areas[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def box_area(box):
+    x1, y1, x2, y2 = box
+    return (x2 - x1) * (y2 - y1)
+
+
+class CropDeduplicator:
+    # Groups near-identical crops so identification and OCR run once per group.
+    # Two objects are duplicates when their boxes and masks overlap heavily (the same object detected twice),
+    # or when their crops are pixel-for-pixel copies (a repeated logo or badge). Crops from one template with
+    # different text hash alike, so a close difference hash only nominates a pair; it is grouped only when both
+    # crops have the same pixel size and no pixel differs by more than max_pixel_difference.
+    def __init__(self, box_iou_threshold=0.85, mask_iou_threshold=0.8, hash_size=8, max_hash_distance=4,
+                 max_pixel_difference=12, min_contrast=4.0):
+        self.box_iou_threshold = box_iou_threshold
+        self.mask_iou_threshold = mask_iou_threshold
+        self.hash_size = hash_size
+        self.max_hash_distance = max_hash_distance  # Differing hash bits tolerated; None disables hash matching
+        self.max_pixel_difference = max_pixel_difference  # Per channel, on a 0-255 scale
+        self.min_contrast = min_contrast  # Flat crops all hash alike, so they are never matched by hash
+
+    # Difference hash of a crop: one bit per horizontally adjacent pixel pair of a small grayscale copy.
+    # Returns None for crops too flat to hash meaningfully.
+    def dhash(self, image_input):
+        if isinstance(image_input, str):
+            image_input = Image.open(image_input)
+        gray = np.asarray(image_input.convert('L').resize((self.hash_size + 1, self.hash_size), Image.BILINEAR),
+                          dtype=np.int16)
+        if gray.std() < self.min_contrast:
+            return None
+        return np.packbits(gray[:, 1:] > gray[:, :-1])
+
+    # Whether two crops are copies of each other: the same pixel size and every pixel within max_pixel_difference
+    def identical(self, image, other):
+        if image.size != other.size:
+            return False
+        pixels = np.asarray(image.convert('RGB'), dtype=np.int16)
+        other_pixels = np.asarray(other.convert('RGB'), dtype=np.int16)
+        return int(np.abs(pixels - other_pixels).max()) <= self.max_pixel_difference
+
+    # Group object indices; masks, when given, are the CompactMasks the objects were extracted from
+    def group(self, extracted_objects, masks=None):
+        count = len(extracted_objects)
+        parents = list(range(count))
+
+        def find(i):
+            while parents[i] != i:
+                parents[i] = parents[parents[i]]
+                i = parents[i]
+            return i
+
+        def join(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+
+        if count < 2:
+            return [[i] for i in range(count)]
+
+        # Overlapping detections of the same object
+        ious = box_iou_matrix([obj['bbox'] for obj in extracted_objects])
+        for i, j in zip(*np.nonzero(np.triu(ious >= self.box_iou_threshold, k=1))):
+            if masks is None or masks[i].iou(masks[j]) >= self.mask_iou_threshold:
+                join(i, j)
+
+        # Repeated artwork anywhere in the image: the hash finds candidate pairs, the pixels confirm them
+        if self.max_hash_distance is not None:
+            images = [obj['image'] if obj.get('image') is not None else Image.open(obj['file_path'])
+                      for obj in extracted_objects]
+            hashes = [self.dhash(image) for image in images]
+            hashed = [i for i, value in enumerate(hashes) if value is not None]
+            if len(hashed) > 1:
+                bits = np.unpackbits(np.stack([hashes[i] for i in hashed]), axis=1).astype(bool)
+                distances = (bits[:, None, :] != bits[None, :, :]).sum(axis=2)
+                for a, b in zip(*np.nonzero(np.triu(distances <= self.max_hash_distance, k=1))):
+                    i, j = hashed[a], hashed[b]
+                    if find(i) != find(j) and self.identical(images[i], images[j]):
+                        join(i, j)
+
+        groups = {}
+        for i in range(count):
+            groups.setdefault(find(i), []).append(i)
+        return list(groups.values())
+
+    # Split the objects into one representative per group and a map from each representative's ID to its members.
+    # The representative is the member with the largest crop, which carries the most detail.
+    @instrument('deduplicate_crops', objects='extracted_objects')
+    def deduplicate(self, extracted_objects, masks=None):
+        representatives = []
+        members = {}
+        for indices in self.group(extracted_objects, masks):
+            group = [extracted_objects[i] for i in indices]
+            representative = max(group, key=lambda obj: box_area(obj['bbox']))
+            representatives.append(representative)
+            members[representative['id']] = group
+
+        if len(representatives) < len(extracted_objects):
+            print(f"Deduplicated {len(extracted_objects)} objects into {len(representatives)} groups.")
+        return representatives, members
+
+    # Copy each representative's result to every member of its group, under the member's ID, file and crop.
+    # Results for IDs outside the map are passed through unchanged.
+    @staticmethod
+    def fan_out(results, members):
+        fanned = []
+        for result in results:
+            for member in members.get(result['id'], [result]):
+                copy = dict(result, id=member['id'], file_path=member.get('file_path'))
+                if 'image' in result:
+                    copy['image'] = member.get('image')
+                fanned.append(copy)
+        return fanned
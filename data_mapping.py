@@ -1,11 +1,14 @@
 import json
 import os
+from metadata_store import MetadataStore
+from instrumentation import instrument
 
 class DataMapper:
-    def __init__(self, identified_objects_file='identified_objects.json', summarized_attributes_file='summarized_attributes.json', metadata_dir='metadata'):
+    def __init__(self, identified_objects_file='identified_objects.json', summarized_attributes_file='summarized_attributes.json', metadata_dir='metadata', metadata_store=None):
         self.identified_objects_file = identified_objects_file
         self.summarized_attributes_file = summarized_attributes_file
         self.metadata_dir = metadata_dir
+        self._metadata_store = metadata_store
 
     def load_data(self):
         # Load identified objects
@@ -16,54 +19,72 @@ class DataMapper:
         with open(self.summarized_attributes_file, 'r') as f:
             self.summarized_attributes = json.load(f)
 
+    # The metadata store is only opened when metadata isn't handed over in memory
+    @property
+    def metadata_store(self):
+        if self._metadata_store is None:
+            self._metadata_store = MetadataStore(os.path.join(self.metadata_dir, 'metadata.db'),
+                                                 legacy_dir=self.metadata_dir)
+        return self._metadata_store
+
     def load_metadata(self, object_id):
-        # Load metadata from the corresponding file in the metadata folder
-        metadata_file = os.path.join(self.metadata_dir, f"{object_id}.json")
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-            return metadata
-        else:
-            print(f"Metadata file for {object_id} not found.")
-            return None
+        # Load metadata for one object from the metadata store
+        metadata = self.metadata_store.get(object_id)
+        if metadata is None:
+            print(f"Metadata for {object_id} not found.")
+        return metadata
 
-    def map_data(self):
-        mapped_data = []
+    # Join identified objects with their metadata and summaries by object ID
+    @instrument('map_data', objects=len)
+    def map_data(self, identified_objects=None, summarized_attributes=None, metadata=None):
+        if identified_objects is None:
+            identified_objects = self.identified_objects
+        if summarized_attributes is None:
+            summarized_attributes = self.summarized_attributes
+
+        # Fetch the metadata of every object in one query unless it was passed in
+        if metadata is None:
+            metadata = self.metadata_store.get_many(obj['id'] for obj in identified_objects)
+
+        # Index the summaries once so each lookup is constant time
+        summaries = {item['id']: item for item in summarized_attributes}
 
-        for obj in self.identified_objects:
+        mapped_data = []
+        for obj in identified_objects:
             object_id = obj['id']
             
-            # Load metadata to get the master_id and bounding box
-            metadata = self.load_metadata(object_id)
-            if metadata is None:
+            # Look up metadata to get the master_id and bounding box
+            object_metadata = metadata.get(object_id)
+            if object_metadata is None:
+                print(f"Metadata for {object_id} not found.")
                 continue  # Skip if metadata is missing
-            
-            master_id = metadata['master_id']
 
             # Find the corresponding summary for this object by ID
-            summary = next((item for item in self.summarized_attributes if item['id'] == object_id), None)
+            summary = summaries.get(object_id)
             if not summary:
                 print(f"Summary for object {object_id} not found.")
                 continue
 
-            # Combine all relevant data
-            mapped_object = {
-                "id": object_id,
-                "master_id": master_id,
-                "file_path": obj['file_path'],
-                "labels": obj['labels'],
-                "confidences": obj['confidences'],
-                "bbox": metadata['bbox'],
-                "extracted_text": summary['extracted_text'],
-                "summary": summary['summary']
-            }
-
-            mapped_data.append(mapped_object)
+            mapped_data.append(self.map_object(obj, object_metadata, summary))
 
         return mapped_data
 
-    def save_mapped_data(self, output_file='mapped_data.json'):
-        mapped_data = self.map_data()
+    def map_object(self, obj, metadata, summary):
+        # Combine all relevant data
+        return {
+            "id": obj['id'],
+            "master_id": metadata['master_id'],
+            "file_path": obj.get('file_path'),
+            "labels": obj['labels'],
+            "confidences": obj['confidences'],
+            "bbox": metadata['bbox'],
+            "extracted_text": summary['extracted_text'],
+            "summary": summary['summary']
+        }
+
+    def save_mapped_data(self, output_file='mapped_data.json', mapped_data=None):
+        if mapped_data is None:
+            mapped_data = self.map_data()
         with open(output_file, 'w') as f:
             json.dump(mapped_data, f, indent=4)
         print(f"Mapped data saved to {output_file}.")
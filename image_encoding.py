@@ -0,0 +1,106 @@
+import io
+import os
+from PIL import Image
+
+# File extension written for each supported format
+EXTENSIONS = {'PNG': '.png', 'JPEG': '.jpg', 'WEBP': '.webp'}
+# Longest side WebP can encode
+WEBP_MAX_SIZE = 16383
+
+
+class ImageEncoding:
+    # How one kind of image artefact is written. quality (1-100) applies to JPEG and WebP, compress_level (0-9,
+    # lower is faster and larger) to PNG, and method (0-6, lower is faster) to WebP. Unset options keep
+    # Pillow's defaults.
+    def __init__(self, format='PNG', quality=None, compress_level=None, method=None):
+        self.format = format.upper().replace('JPG', 'JPEG')
+        if self.format not in EXTENSIONS:
+            raise ValueError(f"Unsupported image format '{format}'; choose one of {', '.join(EXTENSIONS)}")
+        for name, value, low, high in (('quality', quality, 0, 100), ('compress_level', compress_level, 0, 9),
+                                       ('method', method, 0, 6)):
+            if value is not None and not low <= value <= high:
+                raise ValueError(f"Image {name} must be between {low} and {high}, got {value}")
+        self.quality = quality
+        self.compress_level = compress_level
+        self.method = method
+
+    # Parse FORMAT[:LEVEL[:METHOD]], where LEVEL is the quality for JPEG and WebP and the compression level
+    # for PNG, e.g. 'png:1', 'jpeg:85' or 'webp:85:0'
+    @classmethod
+    def parse(cls, spec):
+        format, *values = spec.split(':')
+        try:
+            values = [int(value) for value in values]
+        except ValueError:
+            raise ValueError(f"Invalid image encoding '{spec}'; levels must be integers") from None
+        if len(values) > (1 if format.upper() == 'PNG' else 2):
+            raise ValueError(f"Invalid image encoding '{spec}'; too many levels for {format}")
+        if format.upper() == 'PNG':
+            return cls('PNG', compress_level=values[0] if values else None)
+        return cls(format, quality=values[0] if values else None, method=values[1] if len(values) > 1 else None)
+
+    @property
+    def extension(self):
+        return EXTENSIONS[self.format]
+
+    # The path with its extension replaced by this format's
+    def path(self, path):
+        return os.path.splitext(path)[0] + self.extension
+
+    def save_options(self):
+        options = {'quality': self.quality, 'compress_level': self.compress_level, 'method': self.method}
+        return {key: value for key, value in options.items() if value is not None}
+
+    def prepare(self, image):
+        # JPEG has no alpha channel or palette
+        if self.format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            return image.convert('RGB')
+        return image
+
+    # Encoding actually used for an image: images too large for WebP are written as PNG instead
+    def for_image(self, image):
+        if self.format == 'WEBP' and max(image.size) > WEBP_MAX_SIZE:
+            return ImageEncoding('PNG')
+        return self
+
+    # Write the image next to path under its format's extension and return the path written
+    def save(self, image, path):
+        encoding = self.for_image(image)
+        path = encoding.path(path)
+        encoding.prepare(image).save(path, format=encoding.format, **encoding.save_options())
+        return path
+
+    def encode(self, image):
+        encoding = self.for_image(image)
+        buffer = io.BytesIO()
+        encoding.prepare(image).save(buffer, format=encoding.format, **encoding.save_options())
+        return buffer.getvalue()
+
+
+# Crops stay lossless because identification and OCR read them back; they use a fast compression level.
+# The segmentation preview is photographic and the final output is large, so both are stored lossy.
+DEFAULT_ENCODINGS = {
+    'crop': ImageEncoding('PNG', compress_level=1),
+    'segmentation': ImageEncoding('JPEG', quality=90),
+    'final_output': ImageEncoding('WEBP', quality=85, method=0),
+    'table': ImageEncoding('PNG'),
+}
+
+
+# Encoding for every artefact type, with overrides given as ImageEncodings or spec strings
+def image_encodings(overrides=None):
+    encodings = dict(DEFAULT_ENCODINGS)
+    for artefact, encoding in (overrides or {}).items():
+        if artefact not in encodings:
+            raise ValueError(f"Unknown image artefact '{artefact}'; choose one of {', '.join(encodings)}")
+        encodings[artefact] = ImageEncoding.parse(encoding) if isinstance(encoding, str) else encoding
+    return encodings
+
+
+# Downscaled copy for display; the full-resolution image stays on disk
+def preview_image(image, max_size=1024):
+    if max(image.size) <= max_size:
+        return image
+    preview = image.copy()
+    preview.thumbnail((max_size, max_size), Image.BILINEAR)
+    return preview
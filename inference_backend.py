@@ -0,0 +1,232 @@
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import torch
+from model_store import artefact_dir, require, segmentation_weights_path, yolov5_weights_path
+
+# 'eager' runs the float32 model as loaded. 'quantized' converts the Linear layers to dynamic INT8 and
+# 'torchscript' compiles the model; both are CPU-only and their converted models are cached on disk.
+SEGMENTER_BACKENDS = ('eager', 'quantized', 'torchscript')
+IDENTIFIER_BACKENDS = ('eager', 'torchscript')
+
+
+def check_backend(backend, supported):
+    if backend not in supported:
+        raise ValueError(f"Unsupported inference backend '{backend}'; choose one of {', '.join(supported)}")
+
+
+# Cached artefacts are tied to the torch version that wrote them
+def artefact_path(directory, name, backend, extension='pt'):
+    version = torch.__version__.split('+')[0]
+    return os.path.join(artefact_dir(directory), f"{name}.{backend}.torch-{version}.{extension}")
+
+
+def save_atomically(save, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Eager Mask R-CNN built from the local COCO weights, without torchvision's download
+def build_segmentation_model(directory=None):
+    from torchvision.models.detection import maskrcnn_resnet50_fpn
+    model = maskrcnn_resnet50_fpn(weights=None, weights_backbone=None)
+    state_dict = torch.load(require(segmentation_weights_path(directory)), map_location='cpu', weights_only=True)
+    model.load_state_dict(state_dict)
+    return model
+
+
+# Eager YOLOv5 AutoShape model from a local checkpoint, via the yolov5 package instead of torch.hub
+def build_identification_model(model_name='yolov5s', directory=None, device=None):
+    import yolov5
+    return yolov5.load(require(yolov5_weights_path(model_name, directory)), device=device)
+
+
+# Return the segmentation model for a backend. The eager model is only built when the converted one
+# isn't cached yet.
+def load_segmentation_model(backend='eager', directory=None, name='maskrcnn_resnet50_fpn'):
+    check_backend(backend, SEGMENTER_BACKENDS)
+    if backend == 'eager':
+        return build_segmentation_model(directory)
+
+    path = artefact_path(directory, name, backend)
+    if os.path.exists(path):
+        print(f"Loading {backend} {name} from {path}...")
+        if backend == 'torchscript':
+            return torch.jit.load(path, map_location='cpu')
+        return torch.load(path, map_location='cpu', weights_only=False)
+
+    print(f"Converting {name} to {backend}...")
+    model = build_segmentation_model(directory).eval()
+    if backend == 'quantized':
+        # The box head's fully connected layers dominate per-proposal cost and quantise well
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        save_atomically(lambda tmp_path: torch.save(model, tmp_path), path)
+    else:
+        model = torch.jit.script(model)
+        save_atomically(lambda tmp_path: torch.jit.save(model, tmp_path), path)
+    return model
+
+
+# Trace the network inside a YOLOv5 AutoShape model at a fixed input size and save it in the TorchScript
+# format YOLOv5 itself exports, so yolov5.load can read it back. The trace is for a batch of one;
+# ObjectIdentifier runs the traced model one crop at a time.
+def export_yolov5_torchscript(autoshape_model, path, image_size=640):
+    detection_model = copy.deepcopy(autoshape_model.model.model).cpu().eval()  # AutoShape -> backend -> model
+    for module in detection_model.modules():
+        if type(module).__name__ == 'Detect':
+            module.export = True  # Return only the concatenated predictions
+
+    example = torch.zeros(1, 3, image_size, image_size)
+    traced = torch.jit.trace(detection_model, example, strict=False)
+    config = {'shape': list(example.shape), 'stride': int(max(detection_model.stride)),
+              'names': autoshape_model.names}
+    extra_files = {'config.txt': json.dumps(config)}  # Read back by YOLOv5 for the class names and stride
+    save_atomically(lambda tmp_path: torch.jit.save(traced, tmp_path, _extra_files=extra_files), path)
+
+
+# Return the YOLOv5 AutoShape model for a backend; the TorchScript model letterboxes every crop to image_size
+def load_identification_model(model_name='yolov5s', backend='eager', directory=None, image_size=640):
+    check_backend(backend, IDENTIFIER_BACKENDS)
+    if backend == 'eager':
+        return build_identification_model(model_name, directory)
+
+    path = artefact_path(directory, f"{model_name}-{image_size}", backend, extension='torchscript')
+    if not os.path.exists(path):
+        print(f"Exporting {model_name} to {backend}...")
+        export_yolov5_torchscript(build_identification_model(model_name, directory, device='cpu'), path, image_size)
+    print(f"Loading {backend} {model_name} from {path}...")
+    import yolov5
+    return yolov5.load(path, device='cpu')
+
+
+# Pairwise IoU between two sets of (x1, y1, x2, y2) boxes
+def box_iou(boxes, other):
+    boxes = torch.as_tensor(boxes, dtype=torch.float64).reshape(-1, 4)
+    other = torch.as_tensor(other, dtype=torch.float64).reshape(-1, 4)
+    top_left = torch.maximum(boxes[:, None, :2], other[None, :, :2])
+    bottom_right = torch.minimum(boxes[:, None, 2:], other[None, :, 2:])
+    intersection = (bottom_right - top_left).clamp(min=0).prod(dim=2)
+    areas = (boxes[:, 2:] - boxes[:, :2]).prod(dim=1)
+    other_areas = (other[:, 2:] - other[:, :2]).prod(dim=1)
+    union = areas[:, None] + other_areas[None, :] - intersection
+    return torch.where(union > 0, intersection / union, torch.zeros_like(union))
+
+
+# Greedily match candidate detections to reference ones with the same label and enough overlap
+def match_detections(reference_boxes, reference_labels, candidate_boxes, candidate_labels, iou_threshold=0.5):
+    if len(reference_boxes) == 0 or len(candidate_boxes) == 0:
+        return 0
+    ious = box_iou(reference_boxes, candidate_boxes)
+    reference_labels = torch.as_tensor([int(label) for label in reference_labels])
+    candidate_labels = torch.as_tensor([int(label) for label in candidate_labels])
+    ious[reference_labels[:, None] != candidate_labels[None, :]] = 0
+    matched = 0
+    for _ in range(min(ious.shape)):
+        best = int(ious.argmax())
+        i, j = divmod(best, ious.shape[1])
+        if ious[i, j] < iou_threshold:
+            break
+        matched += 1
+        ious[i, :] = 0
+        ious[:, j] = 0
+    return matched
+
+
+def time_call(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# Run the eager and the optimised detectors on the same images and report agreement and latency.
+# Segmentation agreement is the F1 of label-and-IoU matched instances; identification agreement is the
+# share of crops whose top label is the same.
+def check_parity(image_paths, segmenter_backend='quantized', identifier_backend='torchscript',
+                 directory=None, iou_threshold=0.5):
+    from segment import ImageSegmenter
+    from object_identification import ObjectIdentifier
+
+    report = {'images': len(image_paths), 'segmenter_backend': segmenter_backend,
+              'identifier_backend': identifier_backend}
+
+    reference = ImageSegmenter(device='cpu', artefact_dir=directory)
+    candidate = ImageSegmenter(backend=segmenter_backend, artefact_dir=directory)
+    matched = reference_count = candidate_count = 0
+    reference_time = candidate_time = 0.0
+    crops = []
+    for image_path in image_paths:
+        (image, _, reference_boxes, reference_labels), seconds = time_call(reference.segment_image, image_path)
+        reference_time += seconds
+        (_, _, candidate_boxes, candidate_labels), seconds = time_call(candidate.segment_image, image_path)
+        candidate_time += seconds
+
+        matched += match_detections(reference_boxes, reference_labels, candidate_boxes, candidate_labels,
+                                    iou_threshold)
+        reference_count += len(reference_boxes)
+        candidate_count += len(candidate_boxes)
+        crops.extend(image.crop(tuple(int(v) for v in box)) for box in reference_boxes)
+
+    report['segmentation'] = {
+        'agreement': round(2 * matched / (reference_count + candidate_count), 4)
+        if reference_count + candidate_count else 1.0,
+        'reference_instances': reference_count,
+        'candidate_instances': candidate_count,
+        'eager_s_per_image': round(reference_time / max(len(image_paths), 1), 4),
+        'optimised_s_per_image': round(candidate_time / max(len(image_paths), 1), 4),
+    }
+
+    # Identification is compared on the crops of the eager segmentation, so both models see the same input
+    objects = [{'id': str(i), 'file_path': None, 'image': crop} for i, crop in enumerate(crops)]
+    reference = ObjectIdentifier(artefact_dir=directory)
+    candidate = ObjectIdentifier(backend=identifier_backend, artefact_dir=directory)
+    reference_results, reference_time = time_call(reference.identify_objects, objects)
+    candidate_results, candidate_time = time_call(candidate.identify_objects, objects)
+    reference_top = {obj['id']: obj['labels'][0] for obj in reference_results}
+    candidate_top = {obj['id']: obj['labels'][0] for obj in candidate_results}
+    agreeing = sum(1 for obj in objects if reference_top.get(obj['id']) == candidate_top.get(obj['id']))
+    report['identification'] = {
+        'agreement': round(agreeing / len(objects), 4) if objects else 1.0,
+        'crops': len(objects),
+        'eager_s_per_crop': round(reference_time / max(len(objects), 1), 4),
+        'optimised_s_per_crop': round(candidate_time / max(len(objects), 1), 4),
+    }
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the optimised CPU detectors agree with the eager ones.")
+    parser.add_argument('source', help="Directory of sample images")
+    parser.add_argument('--segmenter-backend', default='quantized', choices=SEGMENTER_BACKENDS)
+    parser.add_argument('--identifier-backend', default='torchscript', choices=IDENTIFIER_BACKENDS)
+    parser.add_argument('--artefact-dir', help="Directory holding the model weights and converted models "
+                                               "(default: $PIPELINE_ARTEFACT_DIR or models/)")
+    parser.add_argument('--min-agreement', type=float, default=0.95,
+                        help="Fail when either detector agrees with its eager model less than this")
+    parser.add_argument('--report', help="Also write the report to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from batch_process import collect_images
+
+    report = check_parity(collect_images(args.source), args.segmenter_backend, args.identifier_backend,
+                          args.artefact_dir)
+    print(json.dumps(report, indent=4))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    failed = [stage for stage in ('segmentation', 'identification') if report[stage]['agreement'] < args.min_agreement]
+    for stage in failed:
+        print(f"{stage} agreement {report[stage]['agreement']} is below {args.min_agreement}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
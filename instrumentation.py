@@ -0,0 +1,161 @@
+import os
+import sys
+import json
+import time
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# Peak resident set size of this process so far, in MB
+def peak_rss_mb():
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+        return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return round(getattr(memory, 'peak_wset', memory.rss) / (1024 * 1024), 1)
+    return None
+
+
+class StageMetrics:
+    # Collects one record per instrumented stage call and appends it to a JSON-lines file
+    def __init__(self, metrics_file=None):
+        if metrics_file is None:
+            metrics_file = os.environ.get('PIPELINE_METRICS_FILE', os.path.join('metrics', 'stage_metrics.jsonl'))
+        self.metrics_file = metrics_file  # Empty string disables the file output
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def record(self, entry):
+        # Hand the record to every collector active on this thread (e.g. the current Streamlit run)
+        for records in getattr(self.local, 'collectors', []):
+            records.append(entry)
+
+        if not self.metrics_file:
+            return
+        line = json.dumps(entry) + '\n'
+        with self.lock:
+            directory = os.path.dirname(self.metrics_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.metrics_file, 'a') as f:
+                f.write(line)
+
+    # Gather the records produced on this thread inside the with-block
+    @contextmanager
+    def collect(self):
+        records = []
+        collectors = getattr(self.local, 'collectors', None)
+        if collectors is None:
+            collectors = self.local.collectors = []
+        collectors.append(records)
+        try:
+            yield records
+        finally:
+            collectors.remove(records)
+
+
+# Process-wide metrics sink used by the instrument decorator
+metrics = StageMetrics()
+
+
+# Record wall time, CPU time, peak RSS and an object count for every call of a stage method.
+# objects is either a function applied to the result, or the name of an argument (optionally followed by
+# attribute names, e.g. 'self.mapped_data') whose length is counted. Generator methods are recorded once
+# the generator finishes or is closed: the times cover producing the items (including pulling them from
+# upstream iterators, but not the consumer's work between items) and the count is the number yielded.
+def instrument(stage, objects=None):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                wall_s = cpu_s = 0.0
+                count = 0
+                error = None
+                generator = func(*args, **kwargs)
+                try:
+                    while True:
+                        wall_start = time.perf_counter()
+                        cpu_start = time.process_time()
+                        try:
+                            item = next(generator)
+                        except StopIteration:
+                            return
+                        finally:
+                            wall_s += time.perf_counter() - wall_start
+                            cpu_s += time.process_time() - cpu_start
+                        count += 1
+                        yield item
+                except Exception as e:
+                    error = type(e).__name__
+                    raise
+                finally:
+                    generator.close()
+                    metrics.record(stage_entry(stage, wall_s, cpu_s, count if error is None else None, error))
+
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            error = None
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                metrics.record(stage_entry(
+                    stage, time.perf_counter() - wall_start, time.process_time() - cpu_start,
+                    count_objects(objects, signature, args, kwargs, result) if error is None else None, error))
+
+        return wrapper
+    return decorator
+
+
+def stage_entry(stage, wall_s, cpu_s, objects, error=None):
+    entry = {
+        'stage': stage,
+        'timestamp': time.time(),
+        'pid': os.getpid(),
+        'wall_s': round(wall_s, 4),
+        'cpu_s': round(cpu_s, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'objects': objects,
+    }
+    if error:
+        entry['error'] = error
+    return entry
+
+
+def count_objects(objects, signature, args, kwargs, result):
+    try:
+        if objects is None:
+            return None
+        if isinstance(objects, str):
+            name, *attributes = objects.split('.')
+            value = signature.bind(*args, **kwargs).arguments[name]
+            for attribute in attributes:
+                value = getattr(value, attribute)
+            return len(value)
+        return objects(result)
+    except (TypeError, KeyError, AttributeError):
+        return None
@@ -0,0 +1,130 @@
+import os
+import re
+import json
+import bisect
+import functools
+from text_extractor import clean_text
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summary_rules.json')
+
+# Separates texts joined for one batched scan; never part of a keyword
+_SEPARATOR = '\x00'
+# What may follow a keyword inside its word: nothing, or a plural ending
+_WORD_END = r'(?:s|es)?\b'
+
+
+# Texts and keywords are compared after the same cleaning OCR output gets, so 'check-in' in the rules
+# matches 'checkin' read from an image
+def normalize_text(text):
+    return clean_text(text).lower()
+
+
+# Regex alternation for a set of literal keywords, factored through a prefix trie so the engine follows one
+# branch per character instead of trying every keyword at every position
+def trie_pattern(keywords):
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}  # End of a keyword
+
+    def build(node):
+        children = [(char, child) for char, child in sorted(node.items()) if char]
+        if not children:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in children]
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # A keyword ending here may also continue into a longer one; the greedy ? prefers the longer
+        if '' in node:
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return build(trie)
+
+
+class KeywordClassifier:
+    # Assigns each text the first category (in configuration order) any of whose keywords occurs in it.
+    # Keywords match whole words, optionally in the plural, case-insensitively, over all keywords of all
+    # categories in one regex pass.
+    def __init__(self, categories, default=None):
+        self.categories = list(categories)  # [(result, [keywords])], highest priority first
+        self.default = default
+        self.priority = {}
+        for index, (_, keywords) in enumerate(self.categories):
+            for keyword in keywords:
+                keyword = normalize_text(keyword)
+                if keyword:
+                    self.priority.setdefault(keyword, index)
+
+        # The lookahead reports the longest keyword starting at every word start, so overlapping keywords are
+        # all seen; keywords that are whole-word prefixes of the reported one count through the prefix's priority
+        word_end = re.compile(_WORD_END)
+        for keyword in sorted(self.priority, key=len):
+            prefixes = [keyword[:end] for end in range(1, len(keyword))
+                        if keyword[:end] in self.priority and word_end.match(keyword, end)]
+            self.priority[keyword] = min([self.priority[keyword]] + [self.priority[prefix] for prefix in prefixes])
+        self.pattern = None
+        if self.priority:
+            self.pattern = re.compile(r'\b(?=(' + trie_pattern(self.priority) + ')' + _WORD_END + ')')
+
+    def classify(self, text):
+        return self.classify_many([text])[0]
+
+    # Classify a batch of texts with a single scan over their concatenation
+    def classify_many(self, texts):
+        unique = list(dict.fromkeys(texts))
+        best = [len(self.categories)] * len(unique)
+        if self.pattern is not None and unique:
+            # Normalise each text before joining, since lower() can change a text's length
+            lowered = [normalize_text(text) for text in unique]
+            joined = _SEPARATOR.join(lowered)
+            starts = [0]
+            for text in lowered[:-1]:
+                starts.append(starts[-1] + len(text) + 1)
+
+            for match in self.pattern.finditer(joined):
+                index = bisect.bisect_right(starts, match.start()) - 1
+                best[index] = min(best[index], self.priority[match.group(1)])
+
+        results = {text: self.categories[rank][0] if rank < len(self.categories) else self.default
+                   for text, rank in zip(unique, best)}
+        return [results[text] for text in texts]
+
+
+class SummaryRules:
+    # Label descriptions and keyword categories used to summarise objects, read from a JSON file
+    def __init__(self, label_descriptions, categories, default_description="Unknown Object",
+                 default_attributes="General Information"):
+        self.label_descriptions = {str(label).lower(): description for label, description in label_descriptions.items()}
+        self.default_description = default_description
+        self.classifier = KeywordClassifier(
+            [(category['attributes'], category['keywords']) for category in categories], default_attributes)
+
+    @classmethod
+    def from_file(cls, rules_file):
+        with open(rules_file, 'r') as f:
+            config = json.load(f)
+        return cls(**config)
+
+    # Description for a YOLO class name
+    def describe(self, label):
+        return self.label_descriptions.get(str(label).lower(), self.default_description)
+
+    def key_attributes(self, text):
+        return self.classifier.classify(text)
+
+    def key_attributes_many(self, texts):
+        return self.classifier.classify_many(texts)
+
+
+# Rules are compiled once per version of a file and shared by every summarizer in the process. The version is
+# the file's modification time and size, so an edited file is recompiled on its next use.
+def load_rules(rules_file=DEFAULT_RULES_FILE):
+    stat = os.stat(rules_file)
+    return _compile_rules(os.path.abspath(rules_file), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=16)
+def _compile_rules(rules_file, mtime_ns, size):
+    return SummaryRules.from_file(rules_file)
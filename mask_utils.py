@@ -0,0 +1,115 @@
+import numpy as np
+
+
+class CompactMask:
+    # A binary instance mask stored as bit-packed pixels inside its own bounding box,
+    # so memory scales with the object's size instead of the full frame
+    def __init__(self, bits, box, shape, area=None):
+        self.bits = bits  # np.packbits of the cropped boolean mask
+        self.box = tuple(int(v) for v in box)  # (x1, y1, x2, y2), x2/y2 exclusive
+        self.shape = tuple(int(v) for v in shape)  # (H, W) of the full frame
+        self._area = area
+
+    @classmethod
+    def from_array(cls, mask, threshold=0.5):
+        # Accept a soft (float) or boolean full-frame mask
+        mask = np.asarray(mask)
+        bool_mask = mask if mask.dtype == bool else mask > threshold
+        return cls.from_crop(bool_mask, (0, 0), bool_mask.shape)
+
+    @classmethod
+    def from_crop(cls, crop, offset, shape):
+        # Build from a boolean array covering part of the frame, placed at offset (x, y)
+        crop = np.asarray(crop, dtype=bool)
+        rows = np.flatnonzero(crop.any(axis=1))
+        if len(rows) == 0:
+            return cls(np.zeros(0, dtype=np.uint8), (0, 0, 0, 0), shape, area=0)
+        cols = np.flatnonzero(crop.any(axis=0))
+
+        # Shrink to the tight bounding box of the set pixels
+        y1, y2 = rows[0], rows[-1] + 1
+        x1, x2 = cols[0], cols[-1] + 1
+        tight = crop[y1:y2, x1:x2]
+        ox, oy = offset
+        box = (x1 + ox, y1 + oy, x2 + ox, y2 + oy)
+        return cls(np.packbits(tight), box, shape, area=int(tight.sum()))
+
+    @property
+    def width(self):
+        return self.box[2] - self.box[0]
+
+    @property
+    def height(self):
+        return self.box[3] - self.box[1]
+
+    @property
+    def area(self):
+        if self._area is None:
+            self._area = int(self.crop().sum())
+        return self._area
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    # Decode only the pixels inside the mask's bounding box
+    def crop(self):
+        count = self.width * self.height
+        return np.unpackbits(self.bits, count=count).astype(bool).reshape(self.height, self.width)
+
+    # Decode a region (x1, y1, x2, y2) of the frame, zero outside the mask's box
+    def crop_region(self, region):
+        rx1, ry1, rx2, ry2 = region
+        out = np.zeros((ry2 - ry1, rx2 - rx1), dtype=bool)
+        x1, y1 = max(rx1, self.box[0]), max(ry1, self.box[1])
+        x2, y2 = min(rx2, self.box[2]), min(ry2, self.box[3])
+        if x1 < x2 and y1 < y2:
+            out[y1 - ry1:y2 - ry1, x1 - rx1:x2 - rx1] = self.crop()[
+                y1 - self.box[1]:y2 - self.box[1], x1 - self.box[0]:x2 - self.box[0]]
+        return out
+
+    # Decode to a full-frame boolean array
+    def decode(self):
+        return self.crop_region((0, 0, self.shape[1], self.shape[0]))
+
+    def __array__(self, dtype=None, copy=None):
+        full = self.decode()
+        return full if dtype is None else full.astype(dtype)
+
+    # Number of pixels set in both masks; only the overlap of the two boxes can contain shared pixels
+    def intersection(self, other):
+        region = (max(self.box[0], other.box[0]), max(self.box[1], other.box[1]),
+                  min(self.box[2], other.box[2]), min(self.box[3], other.box[3]))
+        if region[0] >= region[2] or region[1] >= region[3]:
+            return 0
+        return int(np.logical_and(self.crop_region(region), other.crop_region(region)).sum())
+
+    def iou(self, other):
+        intersection = self.intersection(other)
+        union = self.area + other.area - intersection
+        return intersection / union if union else 0.0
+
+    def union(self, other):
+        region = (min(self.box[0], other.box[0]), min(self.box[1], other.box[1]),
+                  max(self.box[2], other.box[2]), max(self.box[3], other.box[3]))
+        merged = np.logical_or(self.crop_region(region), other.crop_region(region))
+        return CompactMask.from_crop(merged, region[:2], self.shape)
+
+    # Scale the mask by a factor into a frame of the given (H, W) shape with nearest-neighbour sampling,
+    # decoding only the scaled box
+    def resize(self, scale, shape):
+        if self.area == 0:
+            return CompactMask(np.zeros(0, dtype=np.uint8), (0, 0, 0, 0), shape, area=0)
+        x1, y1, x2, y2 = self.box
+        nx1, ny1 = int(np.floor(x1 * scale)), int(np.floor(y1 * scale))
+        nx2, ny2 = min(int(np.ceil(x2 * scale)), shape[1]), min(int(np.ceil(y2 * scale)), shape[0])
+
+        # Source pixel under the centre of each target pixel; samples that fall outside the box are empty
+        rows = ((np.arange(ny1, ny2) + 0.5) / scale).astype(int) - y1
+        cols = ((np.arange(nx1, nx2) + 0.5) / scale).astype(int) - x1
+        inside = ((rows >= 0) & (rows < self.height))[:, None] & ((cols >= 0) & (cols < self.width))[None, :]
+        crop = self.crop()[np.ix_(np.clip(rows, 0, self.height - 1), np.clip(cols, 0, self.width - 1))]
+        return CompactMask.from_crop(crop & inside, (nx1, ny1), shape)
+
+    def __repr__(self):
+        return f"CompactMask(box={self.box}, area={self.area}, shape={self.shape})"
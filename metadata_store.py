@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+
+
+class MetadataStore:
+    def __init__(self, db_path='metadata/metadata.db', legacy_dir=None):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # One connection shared by the threads of this process, serialised by a lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.create_schema()
+
+        # Import the old one-JSON-file-per-object directory the first time it is seen
+        if legacy_dir and os.path.isdir(legacy_dir) and not self.is_migrated(legacy_dir):
+            self.migrate_directory(legacy_dir)
+
+    def create_schema(self):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS objects ('
+                'id TEXT PRIMARY KEY, master_id TEXT, data TEXT NOT NULL)'
+            )
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_objects_master_id ON objects (master_id)')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS migrations (source TEXT PRIMARY KEY)')
+
+    # Save one object's metadata
+    def put(self, object_data):
+        self.put_many([object_data])
+
+    # Save many objects' metadata in a single transaction
+    def put_many(self, objects):
+        rows = [(obj['id'], obj.get('master_id'), json.dumps(obj)) for obj in objects]
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO objects (id, master_id, data) VALUES (?, ?, ?)', rows)
+
+    # Retrieve an object's metadata by its ID, or None if it is unknown
+    def get(self, object_id):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM objects WHERE id = ?', (object_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Retrieve metadata for many objects at once, as a dict keyed by object ID
+    def get_many(self, object_ids):
+        object_ids = list(object_ids)
+        found = {}
+        # Stay well below SQLite's limit on bound parameters per statement
+        for start in range(0, len(object_ids), 500):
+            chunk = object_ids[start:start + 500]
+            placeholders = ','.join('?' * len(chunk))
+            with self.lock:
+                rows = self.conn.execute(f'SELECT id, data FROM objects WHERE id IN ({placeholders})', chunk).fetchall()
+            for object_id, data in rows:
+                found[object_id] = json.loads(data)
+        return found
+
+    # Retrieve every object extracted from one master image
+    def get_by_master_id(self, master_id):
+        with self.lock:
+            rows = self.conn.execute('SELECT data FROM objects WHERE master_id = ? ORDER BY rowid', (master_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    # Remove every object extracted from one master image and return how many there were
+    def delete_by_master_id(self, master_id):
+        with self.lock, self.conn:
+            return self.conn.execute('DELETE FROM objects WHERE master_id = ?', (master_id,)).rowcount
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute('SELECT COUNT(*) FROM objects').fetchone()[0]
+
+    def is_migrated(self, source_dir):
+        with self.lock:
+            row = self.conn.execute('SELECT 1 FROM migrations WHERE source = ?', (os.path.abspath(source_dir),)).fetchone()
+        return row is not None
+
+    # Import every <object_id>.json file from a legacy metadata directory
+    def migrate_directory(self, source_dir, batch_size=1000):
+        migrated = 0
+        batch = []
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    with open(entry.path, 'r') as f:
+                        batch.append(json.load(f))
+                except (OSError, ValueError) as e:
+                    print(f"Skipping unreadable metadata file {entry.path}: {e}")
+                    continue
+                if len(batch) >= batch_size:
+                    self.put_many(batch)
+                    migrated += len(batch)
+                    batch = []
+        self.put_many(batch)
+        migrated += len(batch)
+
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO migrations (source) VALUES (?)', (os.path.abspath(source_dir),))
+        print(f"Migrated {migrated} metadata files from {source_dir} into {self.db_path}.")
+        return migrated
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+# Example usage: python metadata_store.py [metadata_dir] [db_path]
+if __name__ == "__main__":
+    source_dir = sys.argv[1] if len(sys.argv) > 1 else 'metadata'
+    db_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(source_dir, 'metadata.db')
+    store = MetadataStore(db_path)
+    store.migrate_directory(source_dir)
+    print(f"{store.count()} objects in {db_path}.")
+    store.close()
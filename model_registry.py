@@ -0,0 +1,100 @@
+import threading
+from result_cache import ResultCache
+from text_prefilter import TextPresenceFilter
+
+
+# Each model module pulls in torch, torchvision or easyocr, so it is imported only when the model is built
+def build_segmenter(**options):
+    from segment import ImageSegmenter
+    return ImageSegmenter(**options)
+
+
+def build_identifier(**options):
+    from object_identification import ObjectIdentifier
+    return ObjectIdentifier(**options)
+
+
+def build_text_extractor(**options):
+    from text_extractor import TextExtractor
+    return TextExtractor(**options)
+
+
+class ModelRegistry:
+    def __init__(self, cache=None, options=None):
+        # Results are cached by input content, so repeated images and crops skip inference
+        self.cache = cache if cache is not None else ResultCache()
+        # Extra constructor arguments per model, e.g. {'text_extractor': {'mode': 'batched'}}
+        self.options = options or {}
+
+        # Factories for every model the pipeline needs; each one is built at most once per process
+        self.factories = {
+            'segmenter': lambda: build_segmenter(**self.model_options('segmenter')),
+            'identifier': lambda: build_identifier(**self.model_options('identifier')),
+            'text_extractor': lambda: build_text_extractor(**self.model_options('text_extractor')),
+        }
+        self.models = {}
+        self.locks = {name: threading.Lock() for name in self.factories}
+        self.warm_up_thread = None
+        self.warm_up_lock = threading.Lock()
+
+    # Constructor arguments for a model: the shared cache and defaults, overridable by the per-model options
+    def model_options(self, name):
+        defaults = {'cache': self.cache}
+        if name == 'text_extractor':
+            defaults['prefilter'] = TextPresenceFilter()  # Skip OCR on crops without visible text
+        return {**defaults, **self.options.get(name, {})}
+
+    # Return the shared instance for a model, loading it on first use
+    def get(self, name):
+        model = self.models.get(name)
+        if model is not None:
+            return model
+
+        # Only one thread builds a given model; the others wait and reuse it
+        with self.locks[name]:
+            model = self.models.get(name)
+            if model is None:
+                print(f"Loading model '{name}'...")
+                model = self.factories[name]()
+                self.models[name] = model
+        return model
+
+    def get_segmenter(self):
+        return self.get('segmenter')
+
+    def get_identifier(self):
+        return self.get('identifier')
+
+    def get_text_extractor(self):
+        return self.get('text_extractor')
+
+    def is_loaded(self, name):
+        return name in self.models
+
+    # Load every registered model, either now or on a background thread
+    def warm_up(self, background=False):
+        if not background:
+            for name in self.factories:
+                self.get(name)
+            return None
+
+        # Start the warm-up thread only once, however many times this is called
+        with self.warm_up_lock:
+            if self.warm_up_thread is None:
+                self.warm_up_thread = threading.Thread(target=self.warm_up, name='model-warm-up', daemon=True)
+                self.warm_up_thread.start()
+        return self.warm_up_thread
+
+
+# Process-wide registry shared by every Streamlit session and rerun
+registry = ModelRegistry()
+
+
+def get_registry():
+    return registry
+
+
+# Example usage: load all models before serving requests
+if __name__ == "__main__":
+    get_registry().warm_up()
+    print("All models loaded.")
@@ -0,0 +1,80 @@
+import os
+import sys
+import argparse
+
+# Local weights for every model, so loading them never touches the network:
+#   <artefact_dir>/maskrcnn_resnet50_fpn_coco.pth  torchvision Mask R-CNN state dict
+#   <artefact_dir>/yolov5s.pt                      YOLOv5 checkpoint
+#   <artefact_dir>/easyocr/                        EasyOCR detector and recognizer weights
+# Converted models written by inference_backend live in the same directory.
+SEGMENTATION_WEIGHTS = 'maskrcnn_resnet50_fpn_coco.pth'
+YOLOV5_RELEASE_URL = 'https://github.com/ultralytics/yolov5/releases/download/v7.0/{}.pt'
+
+
+# Directory holding the model weights: the argument, else $PIPELINE_ARTEFACT_DIR, else models/
+def artefact_dir(directory=None):
+    return directory or os.environ.get('PIPELINE_ARTEFACT_DIR', 'models')
+
+
+def segmentation_weights_path(directory=None):
+    return os.path.join(artefact_dir(directory), SEGMENTATION_WEIGHTS)
+
+
+def yolov5_weights_path(model_name='yolov5s', directory=None):
+    return os.path.join(artefact_dir(directory), f"{model_name}.pt")
+
+
+def easyocr_dir(directory=None):
+    return os.path.join(artefact_dir(directory), 'easyocr')
+
+
+def require(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model weights not found at {path}. Run 'python model_store.py' once (with network "
+                                f"access) to download them, or set PIPELINE_ARTEFACT_DIR to a directory that has them.")
+    return path
+
+
+def download(url, path):
+    import torch
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    print(f"Downloading {url} to {path}...")
+    torch.hub.download_url_to_file(url, path)
+
+
+# Fetch every model the pipeline needs into the artefact directory; files already present are kept
+def download_models(directory=None, yolo_models=('yolov5s',), languages=('en',)):
+    path = segmentation_weights_path(directory)
+    if not os.path.exists(path):
+        from torchvision.models.detection import MaskRCNN_ResNet50_FPN_Weights
+        download(MaskRCNN_ResNet50_FPN_Weights.COCO_V1.url, path)
+
+    for model_name in yolo_models:
+        path = yolov5_weights_path(model_name, directory)
+        if not os.path.exists(path):
+            download(YOLOV5_RELEASE_URL.format(model_name), path)
+
+    # EasyOCR fetches its own detector and recognizer files for the requested languages
+    import easyocr
+    os.makedirs(easyocr_dir(directory), exist_ok=True)
+    easyocr.Reader(list(languages), gpu=False, model_storage_directory=easyocr_dir(directory),
+                   user_network_directory=easyocr_dir(directory), download_enabled=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download the model weights the pipeline loads offline.")
+    parser.add_argument('--artefact-dir', help="Target directory (default: $PIPELINE_ARTEFACT_DIR or models/)")
+    parser.add_argument('--yolo-models', nargs='+', default=['yolov5s'], help="YOLOv5 variants to fetch")
+    parser.add_argument('--languages', nargs='+', default=['en'], help="EasyOCR languages to fetch")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    download_models(args.artefact_dir, args.yolo_models, args.languages)
+    print(f"Models are ready in {artefact_dir(args.artefact_dir)}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
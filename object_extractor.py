@@ -1,13 +1,33 @@
 import os
 import uuid
+import threading
 from PIL import Image
-import json
+from concurrent.futures import ThreadPoolExecutor
+from metadata_store import MetadataStore
+from image_encoding import DEFAULT_ENCODINGS
+from instrumentation import instrument
+
+
+# Drop the in-memory crops so object records can be written as JSON
+def strip_images(objects):
+    return [{key: value for key, value in obj.items() if key != 'image'} for obj in objects]
+
 
 class ObjectExtractor:
-    def __init__(self, output_dir='extracted_objects', metadata_dir='metadata'):
+    def __init__(self, output_dir='extracted_objects', metadata_dir='metadata', save_crops=True, background_save=True,
+                 metadata_store=None, encoding=None):
         self.output_dir = output_dir
         self.metadata_dir = metadata_dir
+        self.save_crops = save_crops
+        self.encoding = encoding or DEFAULT_ENCODINGS['crop']  # Format and compression of the crop files
+        # Crops are handed to later stages in memory; writing them to disk happens off the latency path
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crop-writer') if background_save else None
+        self.pending_writes = []
+        self.pending_lock = threading.Lock()
         self.ensure_dirs()
+        # Indexed metadata store; picks up any legacy per-object JSON files in metadata_dir on first use
+        self.metadata_store = metadata_store or MetadataStore(os.path.join(metadata_dir, 'metadata.db'),
+                                                              legacy_dir=metadata_dir)
 
     # Ensure that the output directories exist
     def ensure_dirs(self):
@@ -16,52 +36,103 @@ class ObjectExtractor:
         if not os.path.exists(self.metadata_dir):
             os.makedirs(self.metadata_dir)
 
-    # Extract objects from image and save them
-    def extract_objects(self, image, masks, boxes, labels):
-        master_id = str(uuid.uuid4())  # Generate a unique ID for the master image
-        extracted_objects = []
-
-        for i, (mask, box, label) in enumerate(zip(masks, boxes, labels)):
-            object_id = str(uuid.uuid4())  # Generate a unique ID for each object
-            
-            # Extract object using the bounding box
-            x1, y1, x2, y2 = map(int, box)
-            object_image = image.crop((x1, y1, x2, y2))
-            
-            # Save the cropped object image
-            file_name = f"{object_id}.png"
-            file_path = os.path.join(self.output_dir, file_name)
-            object_image.save(file_path)
-            
-            # Store metadata
-            object_data = {
-                'id': object_id,
-                'master_id': master_id,
-                'file_path': file_path,
-                'bbox': box.tolist(),
-                'label': int(label)
-            }
-            extracted_objects.append(object_data)
-            
-            # Save metadata as a JSON file
-            self.save_metadata(object_data)
-
+    # Extract objects from image; each record carries its crop in memory under 'image'
+    @instrument('extract_objects', objects=lambda result: len(result[1]))
+    def extract_objects(self, image, masks, boxes, labels, master_id=None, output_dir=None):
+        master_id = master_id or str(uuid.uuid4())  # Generate a unique ID for the master image
+        # Save the metadata of every object in one transaction
+        extracted_objects = list(self.crop_objects(image, masks, boxes, labels, master_id, output_dir,
+                                                   metadata_batch=max(len(boxes), 1)))
         return master_id, extracted_objects
 
-    # Save object metadata to the local file system as a JSON file
+    # Streaming variant of extract_objects: yields each object record, crop included, as soon as it is cropped,
+    # so later stages can start on the first objects and no list of crops is built up
+    @instrument('iter_extract_objects')
+    def iter_extract_objects(self, image, masks, boxes, labels, master_id=None, output_dir=None, metadata_batch=32):
+        master_id = master_id or str(uuid.uuid4())
+        yield from self.crop_objects(image, masks, boxes, labels, master_id, output_dir, metadata_batch)
+
+    # Crop and record one object at a time. Metadata is saved in transactions of metadata_batch objects; a
+    # partial batch is saved when the objects run out or the generator is closed.
+    def crop_objects(self, image, masks, boxes, labels, master_id, output_dir=None, metadata_batch=32):
+        output_dir = output_dir or self.output_dir
+        if self.save_crops:
+            os.makedirs(output_dir, exist_ok=True)
+        pending = []
+
+        try:
+            for mask, box, label in zip(masks, boxes, labels):
+                object_id = str(uuid.uuid4())  # Generate a unique ID for each object
+
+                # Extract object using the bounding box
+                x1, y1, x2, y2 = map(int, box)
+                object_image = image.crop((x1, y1, x2, y2))
+
+                # Optionally persist the cropped object image, under the extension of the format it is written in
+                file_path = None
+                if self.save_crops:
+                    file_path = self.encoding.for_image(object_image).path(os.path.join(output_dir, object_id))
+                    self.save_crop(object_image, file_path)
+
+                # Store metadata
+                object_data = {
+                    'id': object_id,
+                    'master_id': master_id,
+                    'file_path': file_path,
+                    'bbox': box.tolist(),
+                    'label': int(label)
+                }
+                pending.append(object_data)
+                if len(pending) >= metadata_batch:
+                    self.metadata_store.put_many(pending)
+                    pending = []
+
+                yield dict(object_data, image=object_image)
+        finally:
+            if pending:
+                self.metadata_store.put_many(pending)
+
+    # Write a crop to disk, on the background writer when one is configured
+    def save_crop(self, object_image, file_path):
+        if self.writer is None:
+            self.encoding.save(object_image, file_path)
+            return
+        future = self.writer.submit(self.encoding.save, object_image, file_path)
+        with self.pending_lock:
+            # Failed writes are kept so flush() can raise their errors
+            self.pending_writes = [pending for pending in self.pending_writes
+                                   if not pending.done() or pending.exception() is not None]
+            self.pending_writes.append(future)
+
+    # Block until every queued crop has been written, then raise the first error of any write that failed
+    def flush(self):
+        with self.pending_lock:
+            pending_writes, self.pending_writes = self.pending_writes, []
+        errors = [error for error in (future.exception() for future in pending_writes) if error is not None]
+        if errors:
+            raise errors[0]
+
+    # Forget the objects previously extracted from a master image: their metadata and their crop files.
+    # Re-extraction gives objects new IDs, so without this the earlier ones would be left behind.
+    def remove_objects(self, master_id):
+        self.flush()  # A crop still being written would otherwise reappear after its removal
+        for object_data in self.metadata_store.get_by_master_id(master_id):
+            file_path = object_data.get('file_path')
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+        return self.metadata_store.delete_by_master_id(master_id)
+
+    # Save object metadata to the metadata store
     def save_metadata(self, object_data):
-        metadata_file = os.path.join(self.metadata_dir, f"{object_data['id']}.json")
-        with open(metadata_file, 'w') as json_file:
-            json.dump(object_data, json_file, indent=4)
+        self.metadata_store.put(object_data)
 
-    # Retrieve object metadata from the local file system using object ID
+    # Retrieve object metadata from the metadata store using object ID
     def get_object_by_id(self, object_id):
-        metadata_file = os.path.join(self.metadata_dir, f"{object_id}.json")
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as json_file:
-                object_data = json.load(json_file)
-            return object_data
-        return None
+        return self.metadata_store.get(object_id)
+
+    # Retrieve the metadata of every object extracted from one master image
+    def get_objects_by_master_id(self, master_id):
+        return self.metadata_store.get_by_master_id(master_id)
 
 # Example usage:
 # extractor = ObjectExtractor()
@@ -1,47 +1,127 @@
 import os
-import torch
 from PIL import Image
+from result_cache import MISSING
+from instrumentation import instrument
+from inference_backend import load_identification_model
 
 class ObjectIdentifier:
-    def __init__(self, model_name='yolov5s'):
-        # Load YOLOv5 model (small version)
-        print("Loading YOLOv5 model...")
-        self.model = torch.hub.load('ultralytics/yolov5', model_name, pretrained=True)
+    def __init__(self, model_name='yolov5s', batch_size=16, group_by_size=True, image_size=640, cache=None,
+                 model=None, backend='eager', artefact_dir=None):
+        # Load YOLOv5 model (small version) from the local artefact directory unless a preloaded one is passed in
+        if model is None:
+            print("Loading YOLOv5 model...")
+            model = load_identification_model(model_name, backend, artefact_dir, image_size)
+        self.model = model
+        self.backend = backend
+        self.batch_size = batch_size
+        self.group_by_size = group_by_size
+        self.image_size = image_size
+        self.model_name = model_name
+        self.cache = cache  # Optional ResultCache keyed by crop content and model settings
 
-    def identify_objects(self, extracted_objects):
-        identified_objects = []
+    @instrument('identify_objects', objects=len)
+    def identify_objects(self, extracted_objects, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        descriptions = self.identify_inputs(list(self.load_inputs(extracted_objects)), batch_size)
 
-        # Loop through each extracted object image
+        # Keep the input order, dropping objects with no detections
+        return [description for description in descriptions if description is not None]
+
+    # Streaming variant of identify_objects for any iterable of objects: reads batch_size objects at a time and
+    # yields their results, in input order, as soon as the batch's forward pass is done. Batches aren't grouped
+    # by crop shape across the whole image, in exchange for holding only one batch of crops.
+    @instrument('iter_identify_objects')
+    def iter_identify_objects(self, extracted_objects, batch_size=None):
+        batch_size = batch_size or self.batch_size
+        inputs = []
+        for item in self.load_inputs(extracted_objects):
+            inputs.append(item)
+            if len(inputs) == batch_size:
+                yield from (description for description in self.identify_inputs(inputs, batch_size)
+                            if description is not None)
+                inputs = []
+        if inputs:
+            yield from (description for description in self.identify_inputs(inputs, batch_size)
+                        if description is not None)
+
+    # Pair each object with its crop
+    def load_inputs(self, extracted_objects):
         for obj in extracted_objects:
-            image_path = obj['file_path']
-            if not os.path.exists(image_path):
-                print(f"Error: File {image_path} does not exist.")
-                continue
-
-            # Load the object image
-            img = Image.open(image_path)
-            
-            # Perform object detection
-            results = self.model(img)
-            
-            # Get the class label and confidence score
-            predictions = results.pred[0]
-            if len(predictions) > 0:
-                labels = predictions[:, -1].int().tolist()  # Class indices
-                confidences = predictions[:, 4].tolist()    # Confidence scores
-                class_labels = [self.model.names[label] for label in labels]
-
-                # Store the identification details for the object
-                obj_description = {
-                    'id': obj['id'],
-                    'file_path': image_path,
-                    'labels': class_labels,
-                    'confidences': confidences
-                }
-                identified_objects.append(obj_description)
+            image_path = obj.get('file_path')
+
+            # Prefer the crop handed over in memory; fall back to the file on disk
+            img = obj.get('image')
+            if img is None:
+                if not image_path or not os.path.exists(image_path):
+                    print(f"Error: File {image_path} does not exist.")
+                    continue
+                img = Image.open(image_path).convert('RGB')
+            yield obj, img
+
+    # Description of each (object, crop) pair in input order, or None where nothing was detected
+    def identify_inputs(self, inputs, batch_size):
+        # The TorchScript model is traced on a single input, so it is only run one crop at a time
+        if self.backend == 'torchscript':
+            batch_size = 1
+
+        # Reuse detections for crops that have been identified before
+        descriptions = [None] * len(inputs)
+        keys = [self.cache_key(img) for _, img in inputs]
+        order = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key else MISSING
+            if cached is MISSING:
+                order.append(i)
             else:
-                print(f"No objects identified in {image_path}")
+                descriptions[i] = self.describe(inputs[i][0], cached)
+
+        # Crops with similar aspect ratios letterbox to similar shapes, so batching them wastes less padding
+        if self.group_by_size:
+            order.sort(key=lambda i: inputs[i][1].width / max(inputs[i][1].height, 1))
+
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+
+            # Perform object detection on the whole batch in one forward pass
+            results = self.model([inputs[i][1] for i in batch], size=self.image_size)
+
+            for i, predictions in zip(batch, results.pred):
+                detections = self.to_detections(predictions)
+                if keys[i]:
+                    self.cache.set(keys[i], detections)
+                descriptions[i] = self.describe(inputs[i][0], detections)
+        return descriptions
+
+    def cache_key(self, img):
+        if self.cache is None:
+            return None
+        settings = {'model': self.model_name, 'image_size': self.image_size}
+        if self.backend != 'eager':
+            settings['backend'] = self.backend
+        return self.cache.make_key('identification', img, settings)
 
-        return identified_objects
+    # Get the class labels and confidence scores, or None when nothing was detected
+    def to_detections(self, predictions):
+        if len(predictions) == 0:
+            return None
+        labels = predictions[:, -1].int().tolist()  # Class indices
+        confidences = predictions[:, 4].tolist()    # Confidence scores
+        class_labels = [self.model.names[label] for label in labels]
+        return class_labels, confidences
 
+    def describe(self, obj, detections):
+        if detections is None:
+            print(f"No objects identified in object {obj['id']}")
+            return None
+        class_labels, confidences = detections
 
+        # Store the identification details for the object
+        obj_description = {
+            'id': obj['id'],
+            'file_path': obj.get('file_path'),
+            'labels': list(class_labels),
+            'confidences': list(confidences)
+        }
+        if obj.get('image') is not None:
+            obj_description['image'] = obj['image']
+        return obj_description
@@ -1,105 +1,145 @@
+import os
+import csv
+import html
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import matplotlib.font_manager as font_manager
-from PIL import Image
+from PIL import Image, ImageDraw
+from rendering import annotation_style, draw_labeled_box, draw_table, fit_within, load_font, open_image
+from instrumentation import instrument
 
 class OutputGenerator:
-    def __init__(self, original_image_path, mapped_data_file='mapped_data.json', output_image_file='final_output.png'):
+    # Table columns and their rendered widths in pixels
+    TABLE_COLUMNS = (('ID', 340), ('Label', 140), ('Confidence', 110), ('Extracted Text', 380), ('Summary', 560))
+    TABLE_FONT_SIZE = 16
+    # Pages drawn into images by default; the CSV, JSON and HTML exports always hold every row
+    MAX_TABLE_PAGES = 4
+
+    def __init__(self, original_image_path, mapped_data_file='mapped_data.json', output_image_file='final_output.png',
+                 mapped_data=None):
         self.original_image_path = original_image_path
         self.mapped_data_file = mapped_data_file
         self.output_image_file = output_image_file
+        self.mapped_data = mapped_data  # In-memory mapped data; otherwise read with load_mapped_data()
 
     def load_mapped_data(self):
         # Load the mapped data from the JSON file
         with open(self.mapped_data_file, 'r') as f:
             self.mapped_data = json.load(f)
 
-    def annotate_image(self):
+    # Draw boxes and labels directly onto the original pixels and return the annotated image.
+    # max_size optionally caps the longer side of the output.
+    def annotate_image(self, max_size=None):
         # Open the original image
-        original_image = Image.open(self.original_image_path)
-        fig, ax = plt.subplots(1, figsize=(10, 10),dpi=600)
-        ax.imshow(original_image)
+        annotated_image, scale = fit_within(open_image(self.original_image_path), max_size)
+        line_width, font_size = annotation_style(annotated_image)
+        font = load_font(font_size)
+        draw = ImageDraw.Draw(annotated_image, 'RGBA')
 
         # Add bounding boxes and labels from the mapped data
         for obj in self.mapped_data:
-            bbox = obj['bbox']
+            bbox = [v * scale for v in obj['bbox']]
             label = obj['labels'][0]  # Assuming one label per object
-
-            # Create a rectangle patch for each bounding box
-            rect = patches.Rectangle(
-                (bbox[0], bbox[1]),  # x, y
-                bbox[2] - bbox[0],  # width
-                bbox[3] - bbox[1],  # height
-                linewidth=2,
-                edgecolor='r',
-                facecolor='none'
-            )
-
-            # Add the rectangle to the plot
-            ax.add_patch(rect)
-
-            # Add the label as text above the bounding box
-            ax.text(
-                bbox[0], bbox[1] - 10,
-                label,
-                color='white',
-                fontsize=12,
-                bbox=dict(facecolor='red', alpha=0.5)
-            )
-
-        plt.axis('off')
-        plt.savefig(self.output_image_file, bbox_inches='tight', pad_inches=0)
-        plt.close()
-
-    def generate_table(self, table_file='final_table.png'):
-        # Prepare data for the table
-        table_data = []
-        for obj in self.mapped_data:
-            table_data.append({
-                'ID': obj['id'],
-                'Label': obj['labels'][0],
-                'Confidence': round(obj['confidences'][0], 2),
-                'Extracted Text': obj.get('extracted_text', 'N/A'),
-                'Summary': obj.get('summary', 'N/A')  # Ensure this contains only the summarized text
-            })
-    
-        # Create a DataFrame for the table
-        df = pd.DataFrame(table_data)
-    
-        # Plot the table using matplotlib
-        fig, ax = plt.subplots(figsize=(12, len(df) * 0.6), dpi=600)  # Adjust height based on the number of rows
-        ax.axis('tight')
-        ax.axis('off')
-        table = ax.table(cellText=df.values, colLabels=df.columns, cellLoc='center', loc='center')
-    
-        # Save the table as an image
-        plt.savefig(table_file, bbox_inches='tight', pad_inches=0.5)
-        plt.close()
-
-
-    def generate_final_output(self, final_output_file='final_output_with_table.png'):
-        # Generate the annotated image and the table image
-        self.annotate_image()
-        self.generate_table()
-
-        # Combine the annotated image and table image side by side
-        annotated_image = Image.open(self.output_image_file)
-        table_image = Image.open('final_table.png')
-
-        # Create a new image large enough to hold both the annotated image and the table
+            draw_labeled_box(draw, bbox, label, (255, 0, 0), font, line_width=line_width)
+
+        return annotated_image
+
+    # One row per mapped object, shared by the rendered table and the exports
+    def table_rows(self):
+        return [{
+            'ID': obj['id'],
+            'Label': obj['labels'][0],
+            'Confidence': round(obj['confidences'][0], 2),
+            'Extracted Text': obj.get('extracted_text', 'N/A'),
+            'Summary': obj.get('summary', 'N/A')  # Ensure this contains only the summarized text
+        } for obj in self.mapped_data]
+
+    # Render the table page by page, rows_per_page rows at a time, so each page has a bounded size
+    def iter_table_pages(self, rows_per_page=25, max_pages=None):
+        rows = self.table_rows()
+        font = load_font(self.TABLE_FONT_SIZE)
+        columns = [name for name, _ in self.TABLE_COLUMNS]
+        page_count = max(1, -(-len(rows) // rows_per_page))
+        if max_pages:
+            page_count = min(page_count, max_pages)
+
+        for page in range(page_count):
+            start = page * rows_per_page
+            page_rows = rows[start:start + rows_per_page]
+            cells = [[f"{row[name]:.2f}" if name == 'Confidence' else row[name] for name in columns]
+                     for row in page_rows]
+            footer = None
+            if len(rows) > rows_per_page:
+                footer = f"Rows {start + 1}-{start + len(page_rows)} of {len(rows)} (page {page + 1} of {page_count})"
+            yield draw_table(self.TABLE_COLUMNS, cells, font, footer=footer)
+
+    # Render the table and return its first page. With table_file, every page is written as it is rendered:
+    # the first to table_file and the rest to <name>_<page><ext> next to it. An ImageEncoding sets the
+    # format, replacing the file's extension.
+    def generate_table(self, table_file=None, rows_per_page=25, max_pages=None, encoding=None):
+        first_page = None
+        if table_file and encoding is not None:
+            table_file = encoding.path(table_file)
+        root, extension = os.path.splitext(table_file or '')
+        for number, page in enumerate(self.iter_table_pages(rows_per_page, max_pages), start=1):
+            if table_file:
+                page_file = table_file if number == 1 else f"{root}_{number}{extension}"
+                if encoding is not None:
+                    encoding.save(page, page_file)
+                else:
+                    page.save(page_file)
+            if first_page is None:
+                first_page = page
+        return first_page
+
+    # Write the table rows as CSV, JSON or HTML, chosen by the file extension
+    def export_table(self, export_file):
+        rows = self.table_rows()
+        columns = [name for name, _ in self.TABLE_COLUMNS]
+        extension = os.path.splitext(export_file)[1].lower()
+        if extension == '.csv':
+            with open(export_file, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=columns)
+                writer.writeheader()
+                writer.writerows(rows)
+        elif extension == '.json':
+            with open(export_file, 'w', encoding='utf-8') as f:
+                json.dump(rows, f, indent=4)
+        elif extension in ('.html', '.htm'):
+            header = ''.join(f"<th>{html.escape(name)}</th>" for name in columns)
+            body = '\n'.join('<tr>' + ''.join(f"<td>{html.escape(str(row[name])).replace(chr(10), '<br>')}</td>"
+                                              for name in columns) + '</tr>' for row in rows)
+            with open(export_file, 'w', encoding='utf-8') as f:
+                f.write(f"<table>\n<thead><tr>{header}</tr></thead>\n<tbody>\n{body}\n</tbody>\n</table>\n")
+        else:
+            raise ValueError(f"Unsupported table export format '{extension}'; expected .csv, .json or .html")
+        print(f"Table exported to {export_file}.")
+
+    @instrument('generate_final_output', objects='self.mapped_data')
+    def generate_final_output(self, final_output_file='final_output_with_table.png', max_size=None, table_file=None,
+                              rows_per_page=25, max_table_pages=MAX_TABLE_PAGES, export_files=(), encoding=None,
+                              table_encoding=None):
+        # Generate the annotated image and the table in memory; the table pages are only written with table_file
+        annotated_image = self.annotate_image(max_size=max_size)
+        table_image = self.generate_table(table_file, rows_per_page, max_table_pages, encoding=table_encoding)
+        for export_file in export_files:
+            self.export_table(export_file)
+
+        # Create a new image large enough to hold both the annotated image and the table's first page
         total_width = annotated_image.width + table_image.width
         max_height = max(annotated_image.height, table_image.height)
-        combined_image = Image.new('RGB', (total_width, max_height))
+        combined_image = Image.new('RGB', (total_width, max_height), (255, 255, 255))
 
         # Paste the images side by side
         combined_image.paste(annotated_image, (0, 0))
         combined_image.paste(table_image, (annotated_image.width, 0))
 
-        # Save the combined final output
-        combined_image.save(final_output_file)
+        # Save the combined final output; with an encoding, output_image_file records the extension it got
+        if encoding is not None:
+            final_output_file = encoding.save(combined_image, final_output_file)
+        else:
+            combined_image.save(final_output_file)
+        self.output_image_file = final_output_file
         print(f"Final output saved as {final_output_file}.")
+        return combined_image
 
 # Example usage
 if __name__ == "__main__":
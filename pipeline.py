@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import hashlib
+from model_registry import get_registry
+from object_extractor import ObjectExtractor, strip_images
+from post_processing import PostProcessor
+from output_generation import OutputGenerator
+from crop_dedup import CropDeduplicator
+from image_encoding import image_encodings
+from rendering import open_image
+from result_cache import content_digest
+
+# Bump to invalidate every stored stage fingerprint, e.g. when a stage's output format changes
+FINGERPRINT_VERSION = 1
+
+
+# Derive the master ID from the image bytes, so a rerun maps an image to the same output directory
+def master_id_for(image_path):
+    digest = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, digest.hexdigest()))
+
+
+# JSON-friendly description of a stage's configuration: plain values are kept, objects are reduced to their
+# class name and plain attributes, and the shared result cache is left out
+def describe_settings(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(key): describe_settings(item) for key, item in value.items() if key != 'cache'}
+    if isinstance(value, (list, tuple)):
+        return [describe_settings(item) for item in value]
+    attributes = {key: item for key, item in vars(value).items()
+                  if not key.startswith('_') and isinstance(item, (str, int, float, bool, list, tuple, dict))}
+    return {'class': value.__name__ if isinstance(value, type) else type(value).__name__,
+            **describe_settings(attributes)}
+
+
+class Pipeline:
+    # Stages in execution order; each one reads and extends the job dict
+    STAGES = ('segment', 'extract', 'dedup', 'identify', 'ocr', 'post_process', 'render', 'save')
+    DONE_MARKER = 'done.json'
+    # Job entries each stage produces; a stage whose checkpoint was written with its current fingerprint is
+    # skipped and these are restored from the checkpoint. 'save' always runs.
+    STAGE_OUTPUTS = {
+        'segment': ('masks', 'boxes', 'labels'),
+        'extract': ('extracted_objects',),
+        'dedup': ('representatives', 'duplicate_groups'),
+        'identify': ('identified_representatives', 'identified_objects'),
+        'ocr': ('extracted_text',),
+        'post_process': ('summaries', 'mapped_data'),
+        'render': ('rendered_files',),
+    }
+    STAGE_DIR = 'stages'
+
+    def __init__(self, registry=None, output_root='output', metadata_dir='metadata', post_processor=None,
+                 deduplicator=None, incremental=True, encodings=None):
+        self.registry = registry or get_registry()
+        self.output_root = output_root
+        self.incremental = incremental  # Reuse the stored results of stages whose fingerprint hasn't changed
+        self.encodings = image_encodings(encodings)  # Format and compression per image artefact
+        self.extractor = ObjectExtractor(output_dir=os.path.join(output_root, 'crops'), metadata_dir=metadata_dir,
+                                         encoding=self.encodings['crop'])
+        self.post_processor = post_processor or PostProcessor()
+        self.deduplicator = deduplicator or CropDeduplicator()
+
+    def job_dir(self, master_id):
+        return os.path.join(self.output_root, master_id)
+
+    # An image is finished once its done marker has been written. When running incrementally, the marker must
+    # also record the fingerprint the image would get now.
+    def is_done(self, master_id, image_path=None):
+        marker = os.path.join(self.job_dir(master_id), self.DONE_MARKER)
+        if not os.path.exists(marker):
+            return False
+        if not self.incremental or image_path is None:
+            return True
+        with open(marker, 'r') as f:
+            recorded = json.load(f).get('fingerprint')
+        return recorded == self.fingerprints(image_path)['save']
+
+    def new_job(self, image_path, master_id=None):
+        master_id = master_id or master_id_for(image_path)
+        job = {'source': image_path, 'master_id': master_id, 'output_dir': self.job_dir(master_id), 'timings': {}}
+        job['fingerprints'] = self.fingerprints(image_path)
+        job['reusable'] = self.reusable_stages(job) if self.incremental else set()
+
+        # The image is unfinished until save writes the marker again, even if this run stops part-way
+        marker = os.path.join(job['output_dir'], self.DONE_MARKER)
+        if os.path.exists(marker):
+            os.remove(marker)
+        return job
+
+    # Settings that determine each stage's output, given the same input
+    def stage_settings(self, stage):
+        if stage in ('segment', 'identify', 'ocr'):
+            name = {'segment': 'segmenter', 'identify': 'identifier', 'ocr': 'text_extractor'}[stage]
+            return describe_settings(self.registry.model_options(name))
+        if stage == 'extract':
+            return {'save_crops': self.extractor.save_crops, 'encoding': describe_settings(self.encodings['crop'])}
+        if stage == 'dedup':
+            return describe_settings(self.deduplicator)
+        if stage == 'post_process':
+            return {'rules': content_digest(self.post_processor.summarizer.rules_file)}
+        if stage == 'render':
+            return {'output': describe_settings(OutputGenerator),
+                    'encodings': {artefact: describe_settings(self.encodings[artefact])
+                                  for artefact in ('segmentation', 'final_output', 'table')}}
+        return {}
+
+    # Fingerprint of every stage for an image. Each one covers the stage's settings and the fingerprint of the
+    # stage before it, so a change anywhere invalidates everything downstream.
+    def fingerprints(self, image_path):
+        fingerprints = {}
+        previous = content_digest(image_path)
+        for stage in self.STAGES:
+            description = {'version': FINGERPRINT_VERSION, 'stage': stage, 'input': previous,
+                           'settings': self.stage_settings(stage)}
+            previous = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+            fingerprints[stage] = previous
+        return fingerprints
+
+    def checkpoint_path(self, job, stage):
+        return os.path.join(job['output_dir'], self.STAGE_DIR, f"{stage}.pkl")
+
+    # Fingerprint and artefact files recorded at the start of a checkpoint, or None without a checkpoint
+    def checkpoint_header(self, job, stage):
+        path = self.checkpoint_path(job, stage)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    # Stages at the start of the pipeline whose checkpoint was written with the current fingerprint and whose
+    # files are still on disk
+    def reusable_stages(self, job):
+        reusable = set()
+        for stage in self.STAGES:
+            header = None if stage not in self.STAGE_OUTPUTS else self.checkpoint_header(job, stage)
+            if header is None or header['fingerprint'] != job['fingerprints'][stage]:
+                break
+            if not all(os.path.exists(path) for path in header['files']):
+                break
+            reusable.add(stage)
+
+        # Without crop files on disk the crops can't be recovered, so a stage that still needs them has to
+        # start again from the segmentation
+        if not self.extractor.save_crops and 'extract' in reusable and 'ocr' not in reusable:
+            reusable = {'segment'}
+        return reusable
+
+    def run_stage(self, stage, job):
+        start = time.perf_counter()
+        if stage in job.get('reusable', ()):
+            self.restore(stage, job)
+        else:
+            getattr(self, stage)(job)
+            if self.incremental and stage in self.STAGE_OUTPUTS:
+                self.checkpoint(stage, job)
+        job['timings'][stage] = round(time.perf_counter() - start, 4)
+        return job
+
+    # Store a stage's outputs without the in-memory crops; later stages read those from their files. The
+    # checkpoint starts with a header naming the fingerprint it was computed under and the files it relies on,
+    # so a checkpoint overwritten by a run that failed later is never mistaken for one of another run.
+    def checkpoint(self, stage, job):
+        outputs = {}
+        for key in self.STAGE_OUTPUTS[stage]:
+            value = job[key]
+            if key == 'duplicate_groups':
+                value = {representative: strip_images(members) for representative, members in value.items()}
+            elif isinstance(value, list) and value and isinstance(value[0], dict):
+                value = strip_images(value)
+            outputs[key] = value
+
+        if stage == 'extract':
+            files = [obj['file_path'] for obj in job['extracted_objects'] if obj.get('file_path')]
+        elif stage == 'render':
+            files = job['rendered_files']
+        else:
+            files = []
+        header = {'fingerprint': job['fingerprints'][stage], 'files': files}
+
+        path = self.checkpoint_path(job, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(outputs, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def restore(self, stage, job):
+        if stage == 'segment':
+            job['image'] = open_image(job['source'])
+        with open(self.checkpoint_path(job, stage), 'rb') as f:
+            pickle.load(f)  # Header
+            job.update(pickle.load(f))
+
+    # Run every stage for one image and return the finished job
+    def process(self, image_path, master_id=None):
+        job = self.new_job(image_path, master_id)
+        for stage in self.STAGES:
+            self.run_stage(stage, job)
+        return job
+
+    def segment(self, job):
+        image, masks, boxes, labels = self.registry.get_segmenter().segment_image(job['source'])
+        job.update(image=image, masks=masks, boxes=boxes, labels=labels)
+
+    def extract(self, job):
+        self.extractor.remove_objects(job['master_id'])  # Objects of an earlier run of this image
+        _, job['extracted_objects'] = self.extractor.extract_objects(
+            job['image'], job['masks'], job['boxes'], job['labels'],
+            master_id=job['master_id'], output_dir=os.path.join(job['output_dir'], 'crops'))
+
+    # Identification and OCR run on one representative per group of near-identical crops
+    def dedup(self, job):
+        job['representatives'], job['duplicate_groups'] = self.deduplicator.deduplicate(
+            job['extracted_objects'], job['masks'])
+
+    def identify(self, job):
+        job['identified_representatives'] = self.registry.get_identifier().identify_objects(job['representatives'])
+        job['identified_objects'] = self.deduplicator.fan_out(job['identified_representatives'],
+                                                              job['duplicate_groups'])
+
+    def ocr(self, job):
+        extracted_text = self.registry.get_text_extractor().extract_from_objects(job['identified_representatives'])
+        job['extracted_text'] = self.deduplicator.fan_out(extracted_text, job['duplicate_groups'])
+
+    def post_process(self, job):
+        job['summaries'], job['mapped_data'] = self.post_processor.process(
+            job['extracted_objects'], job['identified_objects'], job['extracted_text'])
+
+    # Image files written by the render stage, named with their encoding's extension
+    def render_files(self, job):
+        names = {'segmentation': 'segmented_image', 'final_output': 'final_output_with_table', 'table': 'final_table'}
+        return {artefact: self.encodings[artefact].path(os.path.join(job['output_dir'], name))
+                for artefact, name in names.items()}
+
+    def render(self, job):
+        os.makedirs(job['output_dir'], exist_ok=True)
+        files = self.render_files(job)
+        job['segmented_image'] = self.registry.get_segmenter().visualize_segmentation(
+            job['image'], job['masks'], job['boxes'], job['labels'])
+        segmentation_file = self.encodings['segmentation'].save(job['segmented_image'], files['segmentation'])
+
+        output_generator = OutputGenerator(job['image'], mapped_data=job['mapped_data'])
+        job['final_output'] = output_generator.generate_final_output(
+            files['final_output'], table_file=files['table'],
+            export_files=[os.path.join(job['output_dir'], f"final_table.{extension}")
+                          for extension in ('csv', 'json', 'html')],
+            encoding=self.encodings['final_output'], table_encoding=self.encodings['table'])
+        job['rendered_files'] = [segmentation_file, output_generator.output_image_file]
+
+    # Write the per-image outputs under output/<master_id>/, finishing with the done marker
+    def save(self, job):
+        output_dir = job['output_dir']
+        os.makedirs(output_dir, exist_ok=True)
+
+        results = {
+            'identified_objects.json': strip_images(job['identified_objects']),
+            'extracted_text.json': job['extracted_text'],
+            'summarized_attributes.json': job['summaries'],
+            'mapped_data.json': job['mapped_data'],
+        }
+        for file_name, data in results.items():
+            with open(os.path.join(output_dir, file_name), 'w') as f:
+                json.dump(data, f, indent=4)
+
+        # Crops are written in the background; make sure they are on disk before marking the image done
+        self.extractor.flush()
+
+        marker = os.path.join(output_dir, self.DONE_MARKER)
+        with open(marker + '.tmp', 'w') as f:
+            json.dump(dict(self.summarize(job), fingerprint=job['fingerprints']['save']), f, indent=4)
+        os.replace(marker + '.tmp', marker)
+
+    # Small, picklable description of a finished job
+    def summarize(self, job):
+        return {
+            'source': job['source'],
+            'master_id': job['master_id'],
+            'objects': len(job.get('extracted_objects', [])),
+            'unique_objects': len(job.get('representatives', [])),
+            'identified_objects': len(job.get('identified_objects', [])),
+            'reused_stages': [stage for stage in self.STAGES if stage in job.get('reusable', ())],
+            'timings': dict(job['timings']),
+        }
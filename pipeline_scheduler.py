@@ -0,0 +1,94 @@
+import queue
+import threading
+import traceback
+
+# Marks the end of the input on a queue
+_DONE = object()
+
+
+class PipelineScheduler:
+    # Groups of Pipeline stages that run together on one thread; consecutive groups are joined by bounded queues
+    STAGE_GROUPS = (
+        ('segment', 'extract', 'dedup'),
+        ('identify',),
+        ('ocr',),
+        ('post_process', 'render', 'save'),
+    )
+
+    def __init__(self, pipeline, queue_size=2, workers_per_group=None, stage_groups=None):
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.stage_groups = stage_groups or self.STAGE_GROUPS
+        # Extra threads help a group whose work releases the GIL (e.g. several OCR threads)
+        self.workers_per_group = workers_per_group or {}
+
+    # Push images through every stage concurrently and yield each finished job's summary as it completes.
+    # Items are image paths or (image_path, master_id) pairs.
+    def run(self, items):
+        # A full queue blocks its producer, so a fast stage can never run far ahead of a slow one
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stage_groups]
+        results = queue.Queue()
+        threads = [threading.Thread(target=self.feed, args=(items, queues[0]), name='pipeline-feed', daemon=True)]
+
+        for index, stages in enumerate(self.stage_groups):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else results
+            workers = self.workers_per_group.get(stages[0], 1)
+            remaining = [workers]
+            lock = threading.Lock()
+            for number in range(workers):
+                threads.append(threading.Thread(
+                    target=self.work, args=(stages, inbox, outbox, remaining, lock),
+                    name=f"pipeline-{stages[0]}-{number}", daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            job = results.get()
+            if job is _DONE:
+                break
+            yield self.finish(job)
+
+        for thread in threads:
+            thread.join()
+
+    def feed(self, items, outbox):
+        for item in items:
+            image_path, master_id = item if isinstance(item, tuple) else (item, None)
+            try:
+                job = self.pipeline.new_job(image_path, master_id)
+            except Exception as e:
+                job = {'source': image_path, 'master_id': master_id, 'timings': {}, 'error': repr(e)}
+            outbox.put(job)
+        outbox.put(_DONE)
+
+    def work(self, stages, inbox, outbox, remaining, lock):
+        while True:
+            job = inbox.get()
+            if job is _DONE:
+                # Let sibling workers see the end too; the last one to stop passes it downstream
+                inbox.put(_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    outbox.put(_DONE)
+                return
+
+            # A job that failed upstream is passed along untouched so it is still reported
+            if 'error' not in job:
+                try:
+                    for stage in stages:
+                        self.pipeline.run_stage(stage, job)
+                except Exception as e:
+                    job['error'] = repr(e)
+                    job['traceback'] = traceback.format_exc()
+            outbox.put(job)
+
+    # Reduce a finished job to its summary so its images and masks can be freed
+    def finish(self, job):
+        summary = self.pipeline.summarize(job)
+        if 'error' in job:
+            summary['error'] = job['error']
+        return summary
@@ -0,0 +1,38 @@
+from attribute_summary import AttributeSummarizer
+from data_mapping import DataMapper
+from instrumentation import instrument
+
+
+class PostProcessor:
+    # Summarises and maps the in-memory results of one image in a single pass,
+    # without re-reading the intermediate JSON files from disk
+    def __init__(self, summarizer=None, data_mapper=None):
+        self.summarizer = summarizer or AttributeSummarizer()
+        self.data_mapper = data_mapper or DataMapper()
+
+    @instrument('post_process', objects='identified_objects')
+    def process(self, extracted_objects, identified_objects, extracted_text_data):
+        # Index OCR results and extraction metadata by object ID once, so every join is a dict lookup
+        text_mapping = {item['id']: item['extracted_text'] for item in extracted_text_data}
+        metadata = {obj['id']: obj for obj in extracted_objects}
+
+        # Summaries are generated for the whole batch, so keyword matching is a single pass
+        summaries = self.summarizer.summarize_objects(
+            identified_objects, [text_mapping.get(obj['id'], "No text extracted") for obj in identified_objects])
+
+        mapped_data = []
+        for obj, summary in zip(identified_objects, summaries):
+            object_metadata = metadata.get(obj['id'])
+            if object_metadata is None:
+                print(f"Metadata for {obj['id']} not found.")
+                continue
+            mapped_data.append(self.data_mapper.map_object(obj, object_metadata, summary))
+
+        return summaries, mapped_data
+
+    # Write the results to disk only for the files that are asked for
+    def save(self, summaries, mapped_data, summary_file=None, mapped_file=None):
+        if summary_file:
+            self.summarizer.save_summary(summaries, output_file=summary_file)
+        if mapped_file:
+            self.data_mapper.save_mapped_data(output_file=mapped_file, mapped_data=mapped_data)
@@ -0,0 +1,138 @@
+import colorsys
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+
+# Load a scalable font once per size, falling back to Pillow's built-in font
+@lru_cache(maxsize=16)
+def load_font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:  # Pillow < 10.1 has no sized default font
+            return ImageFont.load_default()
+
+
+# Open an image given as a path, file-like object or PIL image
+def open_image(image_input):
+    if isinstance(image_input, Image.Image):
+        return image_input.convert('RGB')
+    return Image.open(image_input).convert('RGB')
+
+
+# Shrink an image so its longer side is at most max_size; returns the image and the scale applied
+def fit_within(image, max_size=None):
+    if not max_size or max(image.size) <= max_size:
+        return image, 1.0
+    scale = max_size / max(image.size)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR), scale
+
+
+# Distinct, stable colours for n instances as an (n, 3) uint8 array
+def instance_colors(n):
+    golden_ratio = 0.618033988749895
+    colors = [colorsys.hsv_to_rgb((i * golden_ratio) % 1.0, 0.75, 0.95) for i in range(n)]
+    return (np.array(colors, dtype=np.float32).reshape(-1, 3) * 255).astype(np.uint8)
+
+
+# Line width and font size that stay legible relative to the image size
+def annotation_style(image):
+    short_side = min(image.size)
+    return max(2, round(short_side / 300)), max(12, round(short_side / 40))
+
+
+# Draw a bounding box with a filled label tag above it (or inside, at the top edge of the image)
+def draw_labeled_box(draw, box, label, color, font, line_width=2, text_color=(255, 255, 255), tag_alpha=128):
+    x1, y1, x2, y2 = [int(round(v)) for v in box]
+    draw.rectangle((x1, y1, x2, y2), outline=color, width=line_width)
+    if label is None:
+        return
+
+    text = str(label)
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    text_width, text_height = right - left, bottom - top
+    padding = max(2, text_height // 4)
+    tag_height = text_height + 2 * padding
+    tag_top = y1 - tag_height if y1 - tag_height >= 0 else y1
+
+    draw.rectangle((x1, tag_top, x1 + text_width + 2 * padding, tag_top + tag_height), fill=tuple(color[:3]) + (tag_alpha,))
+    draw.text((x1 + padding - left, tag_top + padding - top), text, fill=text_color, font=font)
+
+
+# Wrap text into lines no wider than width pixels. With max_lines, extra lines are dropped and the last kept
+# line ends in an ellipsis, so the work stays bounded however long the text is.
+# Line widths are summed from per-word widths, so each word is measured once.
+def wrap_text(text, font, width, max_lines=None):
+    space = font.getlength(' ')
+    lines = []
+    for paragraph in str(text).split('\n'):
+        line, line_width = '', 0.0
+        for word in paragraph.split():
+            word_width = font.getlength(word)
+            if line and line_width + space + word_width <= width:
+                line, line_width = f"{line} {word}", line_width + space + word_width
+                continue
+            if line:
+                lines.append(line)
+            # Break words that are wider than the column on their own
+            while word_width > width and len(word) > 1:
+                cut = max(1, int(len(word) * width / word_width))
+                while cut > 1 and font.getlength(word[:cut]) > width:
+                    cut -= 1
+                lines.append(word[:cut])
+                word = word[cut:]
+                word_width = font.getlength(word)
+            line, line_width = word, word_width
+            if max_lines and len(lines) > max_lines:
+                break
+        lines.append(line)
+        if max_lines and len(lines) > max_lines:
+            break
+
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        last = lines[-1]
+        while last and font.getlength(last + '…') > width:
+            last = last[:-1]
+        lines[-1] = last + '…'
+    return lines
+
+
+# Draw a table of text cells as an image. columns is a list of (header, width in pixels); long cells wrap
+# to at most max_lines lines. An optional footer line is drawn under the last row.
+def draw_table(columns, rows, font, max_lines=3, padding=6, footer=None):
+    left, top, _, _ = font.getbbox('Ag')
+    line_spacing = 4
+    line_height = font.getbbox('A')[3] + line_spacing  # The line pitch multiline_text uses
+    widths = [width for _, width in columns]
+
+    def cell_lines(values):
+        return [wrap_text(value, font, width - 2 * padding, max_lines) for value, (_, width) in zip(values, columns)]
+
+    header = cell_lines([name for name, _ in columns])
+    body = [cell_lines(row) for row in rows]
+    heights = [max(len(lines) for lines in cells) * line_height + 2 * padding for cells in [header] + body]
+    footer_height = line_height + 2 * padding if footer else 0
+
+    image = Image.new('RGB', (sum(widths) + 1, sum(heights) + footer_height + 1), (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, sum(widths), heights[0]), fill=(230, 230, 230))
+
+    y = 0
+    for cells, height in zip([header] + body, heights):
+        x = 0
+        for lines, width in zip(cells, widths):
+            draw.rectangle((x, y, x + width, y + height), outline=(160, 160, 160))
+            # One call per cell; multiline_text spaces the lines by line_height
+            draw.multiline_text((x + padding - left, y + padding - top), '\n'.join(lines), fill=(0, 0, 0), font=font,
+                                spacing=line_spacing)
+            x += width
+        y += height
+
+    if footer:
+        draw.text((padding - left, y + padding - top), footer, fill=(90, 90, 90), font=font)
+    return image
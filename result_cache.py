@@ -0,0 +1,157 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# Returned by get() on a miss, so cached None results can still be told apart
+MISSING = object()
+
+
+# Hash the pixel content of an image, array or image file
+def content_digest(data):
+    digest = hashlib.sha256()
+    if isinstance(data, Image.Image):
+        digest.update(f"{data.mode}:{data.size}".encode())
+        digest.update(data.tobytes())
+    elif isinstance(data, np.ndarray):
+        digest.update(f"{data.dtype}:{data.shape}".encode())
+        digest.update(np.ascontiguousarray(data).tobytes())
+    elif isinstance(data, str):
+        with open(data, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    else:
+        digest.update(bytes(data))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, cache_dir='cache', max_memory_items=256, max_disk_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # A falsy cache_dir keeps the cache in memory only
+        self.disk_bytes = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self.disk_bytes = sum(size for _, _, size in self.disk_entries())
+
+    # Build a cache key from a stage name, the input content and the settings that affect the result
+    def make_key(self, namespace, data, settings=None):
+        settings_json = json.dumps(settings or {}, sort_keys=True, default=str)
+        key_source = f"{namespace}|{settings_json}|{content_digest(data)}"
+        return hashlib.sha256(key_source.encode()).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+        path = self.disk_path(key)
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    value = pickle.load(f)
+                os.utime(path)  # Mark as recently used for disk eviction
+            except (OSError, pickle.UnpicklingError, EOFError):
+                return self.record_miss()
+            with self.lock:
+                self.hits += 1
+            self.remember(key, value)
+            return value
+
+        return self.record_miss()
+
+    def set(self, key, value):
+        self.remember(key, value)
+
+        path = self.disk_path(key)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        # Overwriting an entry replaces its bytes rather than adding to them
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            self.disk_bytes += size - replaced
+            over_budget = self.disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self.evict_disk()
+
+    def remember(self, key, value):
+        with self.lock:
+            self.memory[key] = value
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.max_memory_items:
+                self.memory.popitem(last=False)
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+        return MISSING
+
+    def disk_path(self, key):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pkl")
+
+    def disk_entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.pkl'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_mtime, stat.st_size
+
+    # Remove least recently used files until the disk tier is back under 90% of its budget
+    def evict_disk(self):
+        entries = sorted(self.disk_entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_disk_bytes * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self.lock:
+            self.disk_bytes = total
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+        if self.cache_dir:
+            for path, _, _ in list(self.disk_entries()):
+                os.remove(path)
+            self.disk_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'memory_items': len(self.memory),
+                    'disk_bytes': self.disk_bytes}
@@ -1,90 +1,222 @@
-from PIL import Image
+from PIL import Image, ImageDraw
 import torch
-import torchvision
-from torchvision.models.detection import maskrcnn_resnet50_fpn
 from torchvision.transforms import functional as F
 import numpy as np
-import matplotlib.pyplot as plt
-import io
+from mask_utils import CompactMask
+import tiling
+from rendering import annotation_style, draw_labeled_box, instance_colors, load_font
+from result_cache import MISSING
+from instrumentation import instrument
+from inference_backend import load_segmentation_model
 
 class ImageSegmenter:
-    def __init__(self):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = maskrcnn_resnet50_fpn(pretrained=True)
+    # How large images are fed to the model: 'full' as they are, 'downscale' shrunk so the longest side is at
+    # most max_size with the results scaled back up, or 'tiled' as overlapping tile_size tiles whose detections
+    # are merged across tile borders
+    RESOLUTIONS = ('full', 'downscale', 'tiled')
+
+    def __init__(self, score_threshold=0.7, mask_threshold=0.5, cache=None, model=None, backend='eager',
+                 artefact_dir=None, device=None, resolution='full', max_size=1333, tile_size=1024, tile_overlap=128,
+                 merge_threshold=0.5):
+        if resolution not in self.RESOLUTIONS:
+            raise ValueError(f"Unknown resolution mode '{resolution}'; expected 'full', 'downscale' or 'tiled'.")
+        if not 0 <= tile_overlap < tile_size:
+            raise ValueError("tile_overlap must be smaller than tile_size.")
+        self.score_threshold = score_threshold
+        self.mask_threshold = mask_threshold
+        self.cache = cache  # Optional ResultCache keyed by image content and thresholds
+        self.resolution = resolution
+        self.max_size = max_size
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        self.merge_threshold = merge_threshold
+        self.backend = backend
+        # The optimised backends only run on CPU
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() and backend == 'eager' else 'cpu'
+        self.device = torch.device(device)
+        # A preloaded model (e.g. a stub for benchmarks) can be passed in instead of the pretrained one,
+        # which is read from the local artefact directory
+        if model is None:
+            model = load_segmentation_model(backend, artefact_dir)
+        self.model = model
         self.model.to(self.device)
         self.model.eval()
 
+    @instrument('segment_image', objects=lambda result: len(result[1]))
     def segment_image(self, image_input):
-        # Check if the input is a file path or an in-memory image
+        # A single image is just a batch of one
+        return self.segment_batch([image_input])[0]
+
+    # Segment many images, running them through the model batch_size inputs at a time
+    def segment_batch(self, images, batch_size=4):
+        # Check if each input is a file path or an in-memory image
+        images = [self.load_image(image_input) for image_input in images]
+        results = [None] * len(images)
+
+        # Serve repeated images straight from the cache
+        keys = [self.cache_key(image) for image in images]
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key else MISSING
+            if cached is MISSING:
+                pending.append(i)
+            else:
+                results[i] = (images[i],) + cached
+
+        # Each image becomes one or more model inputs (the image, a downscaled copy or its tiles).
+        # Inputs of similar aspect ratio are batched together so the model pads them as little as possible.
+        views = [(i, region, scale) for i in pending for region, scale in self.inference_views(images[i])]
+        views.sort(key=lambda view: (view[1][2] - view[1][0]) / (view[1][3] - view[1][1]))
+        detections = {i: [] for i in pending}
+
+        for start in range(0, len(views), batch_size):
+            batch = views[start:start + batch_size]
+
+            # Mask R-CNN takes a list of differently sized tensors and batches them internally.
+            # Tiles and downscaled copies are only materialised for the batch being run.
+            image_tensors = [F.to_tensor(self.view_image(images[i], region, scale)).to(self.device)
+                             for i, region, scale in batch]
+            with torch.no_grad():
+                predictions = self.model(image_tensors)
+            # A TorchScript detection model returns (losses, detections)
+            if isinstance(predictions, tuple):
+                predictions = predictions[1]
+
+            for (i, region, scale), prediction in zip(batch, predictions):
+                frame_shape = (images[i].height, images[i].width)
+                masks, boxes, labels, scores = self.filter_prediction(prediction, region[:2], scale, frame_shape)
+                clipped = self.clipped_boxes(boxes, region, frame_shape)
+                detections[i].append((masks, boxes, labels, scores, clipped))
+
+        for i in pending:
+            masks, boxes, labels = self.merge_detections(detections[i])
+            results[i] = (images[i], masks, boxes, labels)
+            if keys[i]:
+                self.cache.set(keys[i], (masks, boxes, labels))
+
+        return results
+
+    # Model inputs for one image as (region (x1, y1, x2, y2) of the frame, scale from frame to model input)
+    def inference_views(self, image):
+        width, height = image.size
+        if self.resolution == 'downscale' and max(width, height) > self.max_size:
+            return [((0, 0, width, height), self.max_size / max(width, height))]
+        if self.resolution == 'tiled' and max(width, height) > self.tile_size:
+            return [(region, 1.0) for region in self.tile_regions(width, height)]
+        return [((0, 0, width, height), 1.0)]
+
+    def tile_regions(self, width, height):
+        return tiling.tile_regions(width, height, self.tile_size, self.tile_overlap)
+
+    def view_image(self, image, region, scale):
+        if region != (0, 0, image.width, image.height):
+            image = image.crop(region)
+        if scale != 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.BILINEAR)
+        return image
+
+    # Tile merging itself lives in tiling.py, which has no torch dependency
+    def clipped_boxes(self, boxes, region, frame_shape, margin=2):
+        return tiling.clipped_boxes(boxes, region, frame_shape, margin)
+
+    def merge_detections(self, detections):
+        return tiling.merge_detections(detections, self.merge_threshold)
+
+    def cache_key(self, image):
+        if self.cache is None:
+            return None
+        settings = {'model': 'maskrcnn_resnet50_fpn', 'score_threshold': self.score_threshold,
+                    'mask_threshold': self.mask_threshold}
+        if self.backend != 'eager':
+            settings['backend'] = self.backend
+        if self.resolution == 'downscale':
+            settings.update(resolution=self.resolution, max_size=self.max_size)
+        elif self.resolution == 'tiled':
+            settings.update(resolution=self.resolution, tile_size=self.tile_size, tile_overlap=self.tile_overlap,
+                            merge_threshold=self.merge_threshold)
+        return self.cache.make_key('segmentation', image, settings)
+
+    def load_image(self, image_input):
         if isinstance(image_input, str):  # It's a file path
-            image = Image.open(image_input).convert("RGB")
-        else:  # It's already a PIL image object
-            image = image_input.convert("RGB")
-    
-        # Preprocess the image
-        image_tensor = F.to_tensor(image).unsqueeze(0).to(self.device)
-    
-        # Perform inference
-        with torch.no_grad():
-            prediction = self.model(image_tensor)
-    
+            return Image.open(image_input).convert("RGB")
+        return image_input.convert("RGB")  # It's already a PIL image object
+
+    # Keep the confident detections of one model input, mapped into the frame: inputs cut from the frame at
+    # offset (x, y) are shifted back, and inputs shrunk by scale are scaled back up
+    def filter_prediction(self, prediction, offset=(0, 0), scale=1.0, frame_shape=None):
         # Extract masks, boxes, scores, and labels
-        masks = prediction[0]['masks']  # Shape: (N, 1, H, W)
-        boxes = prediction[0]['boxes'].cpu().numpy()  # Shape: (N, 4)
-        scores = prediction[0]['scores'].cpu().numpy()  # Shape: (N,)
-        labels = prediction[0]['labels'].cpu().numpy()  # Shape: (N,)
+        masks = prediction['masks']  # Shape: (N, 1, H, W)
+        boxes = prediction['boxes'].cpu().numpy()  # Shape: (N, 4)
+        scores = prediction['scores'].cpu().numpy()  # Shape: (N,)
+        labels = prediction['labels'].cpu().numpy()  # Shape: (N,)
     
         # Filter out low-confidence predictions
-        score_threshold = 0.7
-        high_confidence_indices = scores > score_threshold
+        high_confidence_indices = scores > self.score_threshold
     
         masks = masks[high_confidence_indices]  # Still has shape (N, 1, H, W)
         boxes = boxes[high_confidence_indices]
         labels = labels[high_confidence_indices]
+        scores = scores[high_confidence_indices]
     
-        # Remove the extra dimension for masks, but ensure we don't collapse into 2D
-        masks = masks[:, 0, :, :].cpu().numpy()  # Now (N, H, W)
-    
-        return image, masks, boxes, labels
-
-
-    def visualize_segmentation(self, image, masks, boxes, labels):
-        plt.figure(figsize=(12, 8))
-        plt.imshow(np.array(image))
-
-        # Generate random colors for each instance
-        colors = [tuple(np.random.rand(3)) for _ in range(len(masks))]
-
-        for mask, box, label, color in zip(masks, boxes, labels, colors):
-            # Create a boolean array from the mask
-            bool_mask = mask > 0.5
-
-            # Create a color mask
-            color_mask = np.zeros((bool_mask.shape[0], bool_mask.shape[1], 4), dtype=np.uint8)
-            color_mask[bool_mask] = [int(x * 255) for x in color] + [128]  # 128 for alpha
-
-            # Overlay the color mask on the image
-            plt.imshow(color_mask)
-
-            # Draw bounding box
-            x1, y1, x2, y2 = box.astype(int)
-            plt.gca().add_patch(plt.Rectangle((x1, y1), x2 - x1, y2 - y1,
-                                              fill=False, edgecolor=color, linewidth=2))
-
-            # Add label
-            plt.text(x1, y1, f"Class {label}", color='white', backgroundcolor=color,
-                     fontsize=8, weight='bold')
-
-        plt.axis('off')
-
-        # Instead of saving, convert plot to image
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', bbox_inches='tight', dpi=300)
-        buf.seek(0)
-        img = Image.open(buf)
-        plt.close()
-
-        return img
+        # Binarise each (1, H, W) soft mask and keep only its box-cropped, bit-packed pixels
+        frame_shape = frame_shape or tuple(masks.shape[-2:])
+        compact_masks = []
+        for mask in masks:
+            if scale == 1.0:
+                compact_masks.append(self.to_compact_mask(mask[0], offset, frame_shape))
+            else:
+                compact_masks.append(self.to_compact_mask(mask[0]).resize(1 / scale, frame_shape))
+
+        boxes = boxes / scale + np.array(offset * 2, dtype=boxes.dtype)
+        return compact_masks, boxes, labels, scores
+
+    def to_compact_mask(self, soft_mask, offset=(0, 0), frame_shape=None):
+        shape = frame_shape or tuple(soft_mask.shape)
+        bool_mask = soft_mask > self.mask_threshold
+
+        # Find the mask's extent on the model's device so only the crop is copied back
+        rows = torch.nonzero(bool_mask.any(dim=1)).flatten()
+        if len(rows) == 0:
+            return CompactMask.from_crop(np.zeros((0, 0), dtype=bool), (0, 0), shape)
+        cols = torch.nonzero(bool_mask.any(dim=0)).flatten()
+        y1, y2 = int(rows[0]), int(rows[-1]) + 1
+        x1, x2 = int(cols[0]), int(cols[-1]) + 1
+
+        crop = bool_mask[y1:y2, x1:x2].cpu().numpy()
+        return CompactMask.from_crop(crop, (x1 + offset[0], y1 + offset[1]), shape)
+
+
+    # Blend every instance mask into the image in one pass and draw boxes and labels on top
+    @instrument('visualize_segmentation', objects='masks')
+    def visualize_segmentation(self, image, masks, boxes, labels, alpha=0.5):
+        pixels = np.asarray(image.convert('RGB'))
+        colors = instance_colors(len(masks))
+
+        # Index of the top-most instance covering each pixel (-1 for background);
+        # each mask only touches the pixels inside its own box
+        instance_index = np.full(pixels.shape[:2], -1, dtype=np.int32)
+        for i, mask in enumerate(masks):
+            if not isinstance(mask, CompactMask):
+                mask = CompactMask.from_array(mask, self.mask_threshold)
+            x1, y1, x2, y2 = mask.box
+            instance_index[y1:y2, x1:x2][mask.crop()] = i
+
+        # Single vectorised blend of the colour overlay into the covered pixels
+        overlay = pixels.copy()
+        covered = instance_index >= 0
+        overlay[covered] = (pixels[covered] * (1 - alpha) + colors[instance_index[covered]] * alpha).astype(np.uint8)
+
+        segmented_image = Image.fromarray(overlay)
+        line_width, font_size = annotation_style(segmented_image)
+        font = load_font(font_size)
+        draw = ImageDraw.Draw(segmented_image, 'RGBA')
+        for box, label, color in zip(boxes, labels, colors):
+            draw_labeled_box(draw, box, f"Class {label}", tuple(int(c) for c in color), font,
+                             line_width=line_width, tag_alpha=255)
+
+        return segmented_image
 
     def process_image(self, image_input):
         # Segment the image
@@ -0,0 +1,14 @@
+import os
+import sys
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import metrics  # noqa: E402
+
+
+# Stage metrics stay in memory instead of being appended to metrics/stage_metrics.jsonl
+@pytest.fixture(autouse=True)
+def no_metrics_file(monkeypatch):
+    monkeypatch.setattr(metrics, 'metrics_file', '')
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from crop_dedup import CropDeduplicator
+
+
+def flyer(text, size=(240, 80)):
+    image = Image.new('RGB', size, (250, 220, 40))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((4, 4, size[0] - 5, size[1] - 5), outline=(180, 20, 20), width=3)
+    draw.text((20, size[1] // 2 - 6), text, fill=(20, 20, 20))
+    return image
+
+
+def objects(*images):
+    records = []
+    for i, image in enumerate(images):
+        # Spread the crops out so only the hash branch can group them
+        x, y = i * 1000, 0
+        records.append({'id': f"obj{i}", 'bbox': [x, y, x + image.width, y + image.height], 'image': image,
+                        'file_path': None, 'label': 1})
+    return records
+
+
+@pytest.mark.parametrize('text, other', [('SALE $99', 'SALE $79'), ('Flight to Paris', 'Flight to Rome'),
+                                         ('50% OFF', '20% OFF'), ('Gate 12', 'Gate 47')])
+def test_same_template_with_different_text_is_not_grouped(text, other):
+    deduplicator = CropDeduplicator()
+    first, second = flyer(text), flyer(other)
+    # The hash alone cannot tell these apart
+    distance = np.unpackbits(deduplicator.dhash(first) ^ deduplicator.dhash(second)).sum()
+    assert distance <= deduplicator.max_hash_distance
+    assert deduplicator.group(objects(first, second)) == [[0], [1]]
+
+
+def test_repeated_artwork_is_grouped():
+    image = flyer('SALE $99')
+    # A slightly brighter copy, as left by a different encoding of the same artwork
+    copy = Image.fromarray(np.clip(np.asarray(image, dtype=np.int16) + 3, 0, 255).astype(np.uint8))
+    assert CropDeduplicator().group(objects(image, image.copy(), copy)) == [[0, 1, 2]]
+
+
+def test_crops_of_different_sizes_are_not_grouped():
+    assert CropDeduplicator().group(objects(flyer('LOGO'), flyer('LOGO', size=(250, 80)))) == [[0], [1]]
+
+
+def test_overlapping_detections_of_one_object_are_grouped():
+    image = flyer('SALE $99')
+    records = objects(image, flyer('Gate 47'))
+    records[1]['bbox'] = [2, 0, 242, 80]
+    assert CropDeduplicator().group(records) == [[0, 1]]
+
+
+def test_fan_out_keeps_text_of_different_crops_apart():
+    deduplicator = CropDeduplicator()
+    records = objects(flyer('SALE $99'), flyer('SALE $79'), flyer('SALE $99'))
+    representatives, members = deduplicator.deduplicate(records)
+    assert [obj['id'] for obj in representatives] == ['obj0', 'obj1']
+    texts = {'obj0': 'SALE $99', 'obj1': 'SALE $79'}
+    results = [{'id': obj['id'], 'text': texts[obj['id']], 'file_path': None} for obj in representatives]
+    fanned = {result['id']: result['text'] for result in deduplicator.fan_out(results, members)}
+    assert fanned == {'obj0': 'SALE $99', 'obj1': 'SALE $79', 'obj2': 'SALE $99'}
@@ -0,0 +1,64 @@
+import io
+import pytest
+from PIL import Image
+from image_encoding import WEBP_MAX_SIZE, ImageEncoding, image_encodings, preview_image
+
+
+def test_parse_sets_level_per_format():
+    assert ImageEncoding.parse('png:1').compress_level == 1
+    jpeg = ImageEncoding.parse('jpg:85')
+    assert (jpeg.format, jpeg.quality) == ('JPEG', 85)
+    webp = ImageEncoding.parse('webp:85:0')
+    assert (webp.format, webp.quality, webp.method) == ('WEBP', 85, 0)
+
+
+def test_unknown_format_and_artefact_are_rejected():
+    with pytest.raises(ValueError):
+        ImageEncoding('GIF')
+    with pytest.raises(ValueError):
+        image_encodings({'thumbnail': 'png'})
+
+
+def test_save_uses_the_format_extension(tmp_path):
+    path = ImageEncoding.parse('jpeg:80').save(Image.new('RGBA', (40, 30)), str(tmp_path / 'image.png'))
+    assert path.endswith('image.jpg')
+    assert Image.open(path).format == 'JPEG'
+
+
+def test_oversized_webp_falls_back_to_png(tmp_path):
+    encoding = ImageEncoding.parse('webp:85:0')
+    image = Image.new('RGB', (WEBP_MAX_SIZE + 617, 50))
+
+    assert Image.open(io.BytesIO(encoding.encode(image))).format == 'PNG'
+    path = encoding.save(image, str(tmp_path / 'final_output_with_table'))
+    assert path.endswith('.png')
+    assert Image.open(path).size == image.size
+
+
+def test_webp_within_limit_stays_webp():
+    image = Image.new('RGB', (WEBP_MAX_SIZE, 20))
+    assert Image.open(io.BytesIO(ImageEncoding('WEBP').encode(image))).format == 'WEBP'
+
+
+def test_preview_keeps_small_images_and_shrinks_large_ones():
+    small = Image.new('RGB', (100, 50))
+    assert preview_image(small, 256) is small
+    assert preview_image(Image.new('RGB', (3000, 1000)), 1024).size == (1024, 341)
+
+
+@pytest.mark.parametrize('spec', ['gif', 'png:fast', 'png:1:2', 'jpeg:101', 'webp:80:9'])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        ImageEncoding.parse(spec)
+
+
+def test_batch_process_validates_encoding_options(capsys):
+    from batch_process import parse_args
+
+    args = parse_args(['images', '--encoding', 'final_output=jpeg:85', '--encoding', 'crop=png:0'])
+    assert [(artefact, encoding.format) for artefact, encoding in args.encoding] == [
+        ('final_output', 'JPEG'), ('crop', 'PNG')]
+    for value in ('final_output', 'thumbnail=png', 'crop=png:x'):
+        with pytest.raises(SystemExit):
+            parse_args(['images', '--encoding', value])
+        assert '--encoding' in capsys.readouterr().err
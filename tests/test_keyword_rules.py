@@ -0,0 +1,89 @@
+import json
+import os
+import random
+import re
+import pytest
+from attribute_summary import AttributeSummarizer
+from keyword_rules import KeywordClassifier, load_rules, normalize_text, trie_pattern
+
+FLIGHT = "Type: Flight Information, Features: Departure and Arrival Details"
+PROMOTION = "Type: Promotion, Features: Limited Time Offer"
+GENERAL = "General Information"
+
+
+@pytest.fixture(scope='module')
+def rules():
+    return load_rules()
+
+
+@pytest.mark.parametrize('text', ["An ideal place to navigate", "Welfare office", "Wholesale cabinet",
+                                  "Jetty road", "Freedom"])
+def test_keywords_inside_other_words_do_not_match(rules, text):
+    assert rules.key_attributes(text) == GENERAL
+
+
+@pytest.mark.parametrize('text', ["Non-stop to Paris", "nonstop to Paris", "One-way tickets", "oneway", "Check-in",
+                                  "checkin desk"])
+def test_hyphenated_keywords_match_with_or_without_ocr_cleaning(rules, text):
+    assert rules.key_attributes(text) == FLIGHT
+
+
+def test_keywords_match_whole_words_and_plurals(rules):
+    assert rules.key_attributes("Hot DEALS today") == PROMOTION
+    assert rules.key_attributes("Cheap fares") == FLIGHT
+    assert rules.key_attributes("Gate 4") == FLIGHT
+
+
+def test_earlier_category_wins(rules):
+    assert rules.key_attributes("Flight sale") == PROMOTION
+    assert rules.key_attributes_many(["Flight sale", "Flight", "", "Flight sale"]) == [
+        PROMOTION, FLIGHT, GENERAL, PROMOTION]
+
+
+def test_whole_word_prefix_keeps_its_priority():
+    classifier = KeywordClassifier([('short', ['first']), ('long', ['first class'])], 'none')
+    assert classifier.classify("first class lounge") == 'short'
+    assert classifier.classify("first classy lounge") == 'short'
+    assert classifier.classify("firstly") == 'none'
+
+
+def test_matches_brute_force_search():
+    rng = random.Random(0)
+    words = ['ab', 'abc', 'abs', 'b c', 'bc', 'cab', 'c', 'abces', 'x']
+    categories = [(index, rng.sample(words, 3)) for index in range(4)]
+    classifier = KeywordClassifier(categories, None)
+
+    def brute_force(text):
+        text = normalize_text(text)
+        for result, keywords in categories:
+            if any(re.search(r'\b' + re.escape(keyword) + r'(?:s|es)?\b', text) for keyword in keywords):
+                return result
+        return None
+
+    texts = [' '.join(rng.choice(words + ['-', 'z']) for _ in range(rng.randint(0, 5))) for _ in range(300)]
+    assert classifier.classify_many(texts) == [brute_force(text) for text in texts]
+
+
+def test_trie_pattern_matches_exactly_the_keywords():
+    keywords = ['air', 'airline', 'airlines', 'airport', 'fare']
+    pattern = re.compile(trie_pattern(keywords))
+    for candidate in keywords + ['ai', 'airlin', 'fares', 'airports']:
+        assert bool(pattern.fullmatch(candidate)) == (candidate in keywords)
+
+
+def test_edited_rules_file_is_reloaded(tmp_path):
+    rules_file = tmp_path / 'rules.json'
+
+    def write_rules(keyword, mtime_ns):
+        rules_file.write_text(json.dumps({'label_descriptions': {},
+                                          'categories': [{'attributes': 'Matched', 'keywords': [keyword]}]}))
+        os.utime(rules_file, ns=(mtime_ns, mtime_ns))
+
+    write_rules('sale', 1_000_000_000)
+    summarizer = AttributeSummarizer(rules_file=str(rules_file))
+    assert summarizer.extract_key_attributes("Big sale") == 'Matched'
+
+    write_rules('gate', 2_000_000_000)
+    assert summarizer.extract_key_attributes("Big sale") == "General Information"
+    assert summarizer.extract_key_attributes("Gate 12") == 'Matched'
+    assert load_rules(str(rules_file)) is load_rules(str(rules_file))
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from mask_utils import CompactMask
+
+
+def random_mask(seed, shape=(37, 53)):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(shape, dtype=bool)
+    y1, x1 = rng.integers(0, shape[0] // 2), rng.integers(0, shape[1] // 2)
+    y2, x2 = rng.integers(y1 + 1, shape[0]), rng.integers(x1 + 1, shape[1])
+    mask[y1:y2, x1:x2] = rng.random((y2 - y1, x2 - x1)) > 0.4
+    return mask
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_pack_unpack_round_trip(seed):
+    mask = random_mask(seed)
+    compact = CompactMask.from_array(mask)
+    assert np.array_equal(compact.decode(), mask)
+    assert np.array_equal(np.asarray(compact), mask)
+    assert compact.area == mask.sum()
+    assert compact.nbytes <= (mask.size + 7) // 8
+
+
+def test_box_is_tight_and_exclusive():
+    mask = np.zeros((20, 30), dtype=bool)
+    mask[5:9, 10:17] = True
+    compact = CompactMask.from_array(mask)
+    assert compact.box == (10, 5, 17, 9)
+    assert (compact.width, compact.height) == (7, 4)
+    assert compact.crop().all()
+
+
+def test_soft_masks_are_thresholded():
+    soft = np.array([[0.2, 0.7], [0.51, 0.5]])
+    assert np.array_equal(CompactMask.from_array(soft).decode(), soft > 0.5)
+
+
+def test_empty_mask():
+    compact = CompactMask.from_array(np.zeros((8, 8), dtype=bool))
+    assert compact.area == 0
+    assert not compact.decode().any()
+    assert compact.iou(compact) == 0.0
+
+
+def test_from_crop_places_the_crop_in_the_frame():
+    crop = np.ones((3, 4), dtype=bool)
+    compact = CompactMask.from_crop(crop, (10, 6), (20, 30))
+    expected = np.zeros((20, 30), dtype=bool)
+    expected[6:9, 10:14] = True
+    assert np.array_equal(compact.decode(), expected)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_set_operations_match_dense_arrays(seed):
+    a, b = random_mask(seed), random_mask(seed + 100)
+    ca, cb = CompactMask.from_array(a), CompactMask.from_array(b)
+    assert ca.intersection(cb) == np.logical_and(a, b).sum()
+    assert np.array_equal(ca.union(cb).decode(), np.logical_or(a, b))
+    union = np.logical_or(a, b).sum()
+    assert ca.iou(cb) == pytest.approx(np.logical_and(a, b).sum() / union if union else 0.0)
+
+
+def test_crop_region_is_zero_outside_the_mask():
+    mask = random_mask(3)
+    compact = CompactMask.from_array(mask)
+    assert np.array_equal(compact.crop_region((5, 4, 40, 30)), mask[4:30, 5:40])
+
+
+def test_resize_matches_nearest_neighbour_sampling():
+    mask = random_mask(7, shape=(40, 60))
+    scale = 0.5
+    resized = CompactMask.from_array(mask).resize(scale, (20, 30))
+    rows = np.clip(((np.arange(20) + 0.5) / scale).astype(int), 0, 39)
+    cols = np.clip(((np.arange(30) + 0.5) / scale).astype(int), 0, 59)
+    assert np.array_equal(resized.decode(), mask[np.ix_(rows, cols)])
+    assert resized.shape == (20, 30)
+
+
+@pytest.mark.parametrize('scale', [0.3, 0.5, 1.0, 2.0, 2.5])
+def test_resize_does_not_grow_the_mask_past_its_box(scale):
+    mask = np.zeros((40, 60), dtype=bool)
+    mask[10:17, 20:31] = True
+    shape = (int(40 * scale), int(60 * scale))
+    resized = CompactMask.from_array(mask).resize(scale, shape)
+    rows = np.clip(((np.arange(shape[0]) + 0.5) / scale).astype(int), 0, 39)
+    cols = np.clip(((np.arange(shape[1]) + 0.5) / scale).astype(int), 0, 59)
+    assert np.array_equal(resized.decode(), mask[np.ix_(rows, cols)])
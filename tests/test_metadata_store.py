@@ -0,0 +1,80 @@
+import json
+import os
+import pytest
+from metadata_store import MetadataStore
+
+
+def record(object_id, master_id='master'):
+    return {'id': object_id, 'master_id': master_id, 'file_path': f"{object_id}.png", 'bbox': [0, 0, 1, 1],
+            'label': 1}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MetadataStore(str(tmp_path / 'metadata.db'))
+    yield store
+    store.close()
+
+
+def test_put_and_lookups(store):
+    store.put_many([record('a'), record('b'), record('c', 'other')])
+    store.put(record('d'))
+    assert store.get('a') == record('a')
+    assert store.get('missing') is None
+    assert set(store.get_many(['a', 'c', 'missing'])) == {'a', 'c'}
+    assert [obj['id'] for obj in store.get_by_master_id('master')] == ['a', 'b', 'd']
+    assert store.count() == 4
+
+
+def test_put_replaces_an_existing_record(store):
+    store.put(record('a'))
+    store.put(dict(record('a'), label=7))
+    assert store.count() == 1
+    assert store.get('a')['label'] == 7
+
+
+def test_get_many_handles_more_ids_than_one_statement_binds(store):
+    store.put_many([record(str(i)) for i in range(1200)])
+    assert len(store.get_many(str(i) for i in range(1200))) == 1200
+
+
+def test_delete_by_master_id(store):
+    store.put_many([record('a'), record('b'), record('c', 'other')])
+    assert store.delete_by_master_id('master') == 2
+    assert store.get_by_master_id('master') == []
+    assert store.get('c') is not None
+
+
+def test_legacy_directory_is_migrated_once(tmp_path, capsys):
+    legacy_dir = tmp_path / 'metadata'
+    legacy_dir.mkdir()
+    for object_id in ('a', 'b', 'c'):
+        (legacy_dir / f"{object_id}.json").write_text(json.dumps(record(object_id)))
+    (legacy_dir / 'broken.json').write_text('{not json')
+    (legacy_dir / 'notes.txt').write_text('ignored')
+    db_path = str(legacy_dir / 'metadata.db')
+
+    store = MetadataStore(db_path, legacy_dir=str(legacy_dir))
+    assert store.count() == 3
+    assert store.get('b') == record('b')
+    assert store.is_migrated(str(legacy_dir))
+    assert 'Skipping unreadable metadata file' in capsys.readouterr().out
+    store.close()
+
+    # A file added after the migration is not imported again by a later store
+    (legacy_dir / 'd.json').write_text(json.dumps(record('d')))
+    store = MetadataStore(db_path, legacy_dir=str(legacy_dir))
+    assert store.count() == 3
+    store.close()
+
+
+def test_migration_in_batches(tmp_path):
+    legacy_dir = tmp_path / 'legacy'
+    legacy_dir.mkdir()
+    for i in range(25):
+        (legacy_dir / f"{i}.json").write_text(json.dumps(record(str(i))))
+    store = MetadataStore(str(tmp_path / 'metadata.db'))
+    assert store.migrate_directory(str(legacy_dir), batch_size=10) == 25
+    assert store.count() == 25
+    assert os.path.exists(tmp_path / 'metadata.db')
+    store.close()
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from image_encoding import WEBP_MAX_SIZE, ImageEncoding
+from metadata_store import MetadataStore
+from object_extractor import ObjectExtractor
+
+
+class FailingEncoding(ImageEncoding):
+    def save(self, image, path):
+        raise OSError('No space left on device')
+
+
+@pytest.fixture
+def make_extractor(tmp_path):
+    extractors = []
+
+    def make(**options):
+        extractor = ObjectExtractor(output_dir=str(tmp_path / 'crops'), metadata_dir=str(tmp_path / 'metadata'),
+                                    metadata_store=MetadataStore(str(tmp_path / 'metadata.db')), **options)
+        extractors.append(extractor)
+        return extractor
+
+    yield make
+    for extractor in extractors:
+        extractor.metadata_store.close()
+
+
+def extract(extractor, image, boxes):
+    boxes = np.array(boxes, dtype=np.float32)
+    return extractor.extract_objects(image, [None] * len(boxes), boxes, [1] * len(boxes), master_id='master')[1]
+
+
+@pytest.mark.parametrize('background_save', [True, False])
+def test_oversized_webp_crop_is_recorded_as_png(make_extractor, background_save):
+    extractor = make_extractor(encoding=ImageEncoding.parse('webp:85:0'), background_save=background_save)
+    image = Image.new('RGB', (WEBP_MAX_SIZE + 100, 40), (200, 30, 30))
+    small, large = extract(extractor, image, [[0, 0, 30, 20], [0, 0, WEBP_MAX_SIZE + 50, 40]])
+    extractor.flush()
+    assert small['file_path'].endswith('.webp') and large['file_path'].endswith('.png')
+    assert extractor.get_object_by_id(large['id'])['file_path'] == large['file_path']
+    assert os.path.exists(small['file_path']) and os.path.exists(large['file_path'])
+
+    extractor.remove_objects('master')
+    assert os.listdir(extractor.output_dir) == []
+
+
+def test_failed_background_write_is_raised_by_flush(make_extractor):
+    extractor = make_extractor(encoding=FailingEncoding('PNG'))
+    image = Image.new('RGB', (100, 100))
+    extract(extractor, image, [[0, 0, 10, 10]])
+    extractor.writer.submit(lambda: None).result()  # The failed write has finished
+    extractor.encoding = ImageEncoding('PNG')
+    extract(extractor, image, [[10, 10, 20, 20]])  # Queuing a good write must not drop the failure
+    with pytest.raises(OSError, match='No space left'):
+        extractor.flush()
+    extractor.flush()  # Reported errors are not raised again
@@ -0,0 +1,144 @@
+import json
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from mask_utils import CompactMask
+from model_registry import ModelRegistry
+from pipeline import Pipeline, master_id_for
+from result_cache import ResultCache
+
+
+class StubSegmenter:
+    def __init__(self, fail_render=False):
+        self.fail_render = fail_render
+
+    def segment_image(self, image_path):
+        image = Image.open(image_path).convert('RGB')
+        masks, boxes = [], []
+        for x1, y1, x2, y2 in ((10, 10, 60, 50), (70, 20, 110, 90)):
+            mask = np.zeros((image.height, image.width), dtype=bool)
+            mask[y1:y2, x1:x2] = True
+            masks.append(CompactMask.from_array(mask))
+            boxes.append((x1, y1, x2, y2))
+        return image, masks, np.array(boxes, dtype=np.float32), np.array([1, 2])
+
+    def visualize_segmentation(self, image, masks, boxes, labels):
+        if self.fail_render:
+            raise RuntimeError("render failed")
+        return image
+
+
+class StubIdentifier:
+    def identify_objects(self, objects):
+        return [{'id': obj['id'], 'file_path': obj.get('file_path'), 'labels': ['person'], 'confidences': [0.9]}
+                for obj in objects]
+
+
+class StubTextExtractor:
+    def __init__(self, mode):
+        self.mode = mode
+        self.calls = 0
+
+    def extract_from_objects(self, objects):
+        self.calls += 1
+        return [{'id': obj['id'], 'file_path': obj.get('file_path'), 'extracted_text': f"read in {self.mode} mode"}
+                for obj in objects]
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'poster.png'
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 255, (100, 120, 3), dtype=np.uint8)).save(path)
+    return str(path)
+
+
+def make_pipeline(tmp_path, mode='sequential', fail_render=False, incremental=True):
+    registry = ModelRegistry(cache=ResultCache(None), options={'text_extractor': {'mode': mode}})
+    registry.models.update(segmenter=StubSegmenter(fail_render), identifier=StubIdentifier(),
+                           text_extractor=StubTextExtractor(mode))
+    return Pipeline(registry=registry, output_root=str(tmp_path / 'output'),
+                    metadata_dir=str(tmp_path / 'metadata'), incremental=incremental)
+
+
+def texts(job):
+    return {item['extracted_text'] for item in job['extracted_text']}
+
+
+def test_fingerprints_chain_settings_downstream(tmp_path, image_path):
+    sequential = make_pipeline(tmp_path).fingerprints(image_path)
+    batched = make_pipeline(tmp_path, mode='batched').fingerprints(image_path)
+    changed = [stage for stage in Pipeline.STAGES if sequential[stage] != batched[stage]]
+    assert changed == ['ocr', 'post_process', 'render', 'save']
+
+
+def test_unchanged_rerun_reuses_every_stage(tmp_path, image_path):
+    first = make_pipeline(tmp_path).process(image_path)
+    assert first['reusable'] == set()
+
+    pipeline = make_pipeline(tmp_path)
+    second = pipeline.process(image_path)
+    assert second['reusable'] == set(Pipeline.STAGE_OUTPUTS)
+    assert pipeline.registry.models['text_extractor'].calls == 0
+    assert texts(second) == texts(first)
+    assert pipeline.is_done(second['master_id'], image_path)
+
+
+def test_changed_setting_reruns_from_its_stage(tmp_path, image_path):
+    make_pipeline(tmp_path).process(image_path)
+
+    pipeline = make_pipeline(tmp_path, mode='batched')
+    master_id = master_id_for(image_path)
+    assert not pipeline.is_done(master_id, image_path)
+    job = pipeline.process(image_path)
+    assert job['reusable'] == {'segment', 'extract', 'dedup', 'identify'}
+    assert texts(job) == {'read in batched mode'}
+    assert pipeline.is_done(master_id, image_path)
+
+
+def test_checkpoints_of_a_failed_run_are_not_reused(tmp_path, image_path):
+    make_pipeline(tmp_path).process(image_path)
+
+    # A run with other OCR settings overwrites the OCR and later checkpoints, then fails before finishing
+    with pytest.raises(RuntimeError):
+        make_pipeline(tmp_path, mode='batched', fail_render=True).process(image_path)
+    master_id = master_id_for(image_path)
+    assert not make_pipeline(tmp_path).is_done(master_id, image_path)
+
+    pipeline = make_pipeline(tmp_path)
+    job = pipeline.process(image_path)
+    assert 'ocr' not in job['reusable']
+    assert pipeline.registry.models['text_extractor'].calls == 1
+    assert texts(job) == {'read in sequential mode'}
+    with open(os.path.join(job['output_dir'], 'extracted_text.json')) as f:
+        assert {item['extracted_text'] for item in json.load(f)} == {'read in sequential mode'}
+
+
+def test_missing_rendered_files_rerun_render(tmp_path, image_path):
+    job = make_pipeline(tmp_path).process(image_path)
+    os.remove(job['rendered_files'][1])
+
+    job = make_pipeline(tmp_path).process(image_path)
+    assert 'render' not in job['reusable'] and 'post_process' in job['reusable']
+    assert all(os.path.exists(path) for path in job['rendered_files'])
+
+
+def test_force_ignores_checkpoints(tmp_path, image_path):
+    make_pipeline(tmp_path).process(image_path)
+    pipeline = make_pipeline(tmp_path, incremental=False)
+    job = pipeline.process(image_path)
+    assert job['reusable'] == set()
+    assert pipeline.registry.models['text_extractor'].calls == 1
+
+
+def test_re_extraction_leaves_no_orphaned_objects(tmp_path, image_path):
+    make_pipeline(tmp_path).process(image_path)
+    make_pipeline(tmp_path, incremental=False).process(image_path)
+
+    pipeline = make_pipeline(tmp_path)
+    job = pipeline.process(image_path)
+    stored = pipeline.extractor.get_objects_by_master_id(job['master_id'])
+    assert sorted(obj['id'] for obj in stored) == sorted(obj['id'] for obj in job['extracted_objects'])
+    crops_dir = os.path.join(job['output_dir'], 'crops')
+    assert sorted(os.listdir(crops_dir)) == sorted(os.path.basename(obj['file_path']) for obj in stored)
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+from PIL import Image
+from result_cache import MISSING, ResultCache, content_digest
+
+
+def test_miss_is_distinct_from_cached_none():
+    cache = ResultCache(None)
+    assert cache.get('key') is MISSING
+    cache.set('key', None)
+    assert cache.get('key') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResultCache(None, max_memory_items=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is MISSING
+    assert cache.get('a') == 1 and cache.get('c') == 3
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResultCache(str(tmp_path)).set('ab12', {'text': 'hello'})
+    cache = ResultCache(str(tmp_path))
+    assert cache.disk_bytes > 0
+    assert cache.get('ab12') == {'text': 'hello'}
+
+
+def test_overwriting_an_entry_keeps_the_disk_size_exact(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for _ in range(5):
+        cache.set('ab12', 'x' * 1000)
+    on_disk = sum(os.path.getsize(os.path.join(root, name))
+                  for root, _, files in os.walk(tmp_path) for name in files)
+    assert cache.disk_bytes == on_disk
+
+
+def test_disk_tier_evicts_least_recently_used_entries(tmp_path):
+    cache = ResultCache(str(tmp_path), max_memory_items=1, max_disk_bytes=3500)
+    for index, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.set(key, b'x' * 1000)
+        os.utime(cache.disk_path(key), (index, index))  # Distinct, ordered access times
+    cache.set('dd04', b'x' * 1000)
+
+    assert cache.disk_bytes <= 3500 * 0.9
+    assert not os.path.exists(cache.disk_path('aa01'))
+    assert os.path.exists(cache.disk_path('dd04'))
+
+
+def test_keys_depend_on_content_and_settings():
+    cache = ResultCache(None)
+    pixels = np.zeros((4, 4, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels)
+    assert content_digest(image) == content_digest(image.copy())
+    assert content_digest(pixels) != content_digest(pixels.astype(np.int16))
+    assert cache.make_key('ocr', image, {'mode': 'batched'}) != cache.make_key('ocr', image, {'mode': 'sequential'})
+    assert cache.make_key('ocr', image, {'a': 1, 'b': 2}) == cache.make_key('ocr', image, {'b': 2, 'a': 1})
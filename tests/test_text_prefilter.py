@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFilter
+from rendering import load_font
+from text_extractor import TextExtractor
+from text_prefilter import TextPresenceFilter
+
+
+def text_crop(text, size, font_size, position=None):
+    image = Image.new('RGB', size, (240, 240, 240))
+    ImageDraw.Draw(image).text(position or (size[0] // 10, size[1] // 3), text, fill=(20, 20, 20),
+                               font=load_font(font_size))
+    return image
+
+
+class RecordingReader:
+    def __init__(self):
+        self.calls = 0
+
+    def readtext(self, image):
+        self.calls += 1
+        return [(None, 'TEXT', 1.0)]
+
+
+@pytest.mark.parametrize('text, size, font_size', [
+    ('SALE', (600, 400), 60),
+    ('SALE', (600, 400), 30),
+    ('Flight AB123 departs 10:45', (1200, 800), 40),
+    ('Flight AB123 departs 10:45', (1200, 800), 24),
+    ('50%', (300, 300), 60),
+    ('Call 555-1234', (800, 200), 40),
+])
+def test_text_crops_are_kept(text, size, font_size):
+    assert TextPresenceFilter().has_text(text_crop(text, size, font_size))
+
+
+def test_small_caption_in_a_large_crop_is_kept():
+    assert TextPresenceFilter().has_text(text_crop('Made in Italy', (900, 900), 18, position=(20, 860)))
+
+
+def test_featureless_crops_are_skipped():
+    prefilter = TextPresenceFilter()
+    flat = Image.new('RGB', (400, 300), (90, 140, 200))
+    gradient = Image.fromarray(np.tile(np.linspace(0, 255, 400).astype(np.uint8), (300, 1)))
+    noise = np.random.default_rng(0).integers(0, 255, (300, 400, 3)).astype(np.uint8)
+    blurred = Image.fromarray(noise).filter(ImageFilter.GaussianBlur(8))
+    for image in (flat, gradient, blurred):
+        assert not prefilter.has_text(image)
+
+
+def test_crops_below_min_size_are_skipped():
+    assert not TextPresenceFilter().has_text(text_crop('A', (40, 10), 10))
+
+
+def test_streaming_ocr_reports_skipped_crops(capsys):
+    reader = RecordingReader()
+    extractor = TextExtractor(reader=reader, prefilter=TextPresenceFilter())
+    objects = [{'id': 'text', 'image': text_crop('SALE', (600, 400), 60)},
+               {'id': 'blank', 'image': Image.new('RGB', (400, 300), (90, 140, 200))}]
+    texts = {record['id']: record['extracted_text'] for record in extractor.iter_extract_from_objects(objects)}
+    assert texts == {'text': 'TEXT', 'blank': ''}
+    assert reader.calls == 1
+    assert extractor.last_stats['skipped_no_text'] == 1
+    assert '1 skipped as text-free' in capsys.readouterr().out
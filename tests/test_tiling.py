@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from mask_utils import CompactMask
+from tiling import clipped_boxes, merge_detections, tile_regions
+
+FRAME = (100, 200)  # (H, W)
+LEFT, RIGHT = (0, 0, 120, 100), (80, 0, 200, 100)
+
+
+def box_mask(x1, y1, x2, y2):
+    return CompactMask.from_crop(np.ones((y2 - y1, x2 - x1), dtype=bool), (x1, y1), FRAME)
+
+
+# What one tile's model input reports for an object, cut to the tile and flagged if it touches an inner edge
+def tile_detection(region, objects):
+    masks, boxes, labels, scores = [], [], [], []
+    for (x1, y1, x2, y2), label, score in objects:
+        x1, y1, x2, y2 = max(x1, region[0]), max(y1, region[1]), min(x2, region[2]), min(y2, region[3])
+        masks.append(box_mask(x1, y1, x2, y2))
+        boxes.append([x1, y1, x2, y2])
+        labels.append(label)
+        scores.append(score)
+    boxes = np.array(boxes, dtype=np.float32).reshape(-1, 4)
+    return masks, boxes, np.array(labels), np.array(scores), clipped_boxes(boxes, region, FRAME)
+
+
+@pytest.mark.parametrize('width, height', [(500, 300), (1024, 1024), (3000, 1100), (2049, 4097)])
+def test_tiles_cover_the_frame_with_overlap(width, height):
+    tile_size, overlap = 1024, 128
+    regions = tile_regions(width, height, tile_size, overlap)
+    covered = np.zeros((height, width), dtype=bool)
+    for x1, y1, x2, y2 in regions:
+        assert x2 - x1 <= tile_size and y2 - y1 <= tile_size
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+
+    xs = sorted({(x1, x2) for x1, _, x2, _ in regions})
+    for (_, end), (start, _) in zip(xs, xs[1:]):
+        assert end - start >= overlap
+
+
+def test_small_frame_is_a_single_tile():
+    assert tile_regions(300, 200, 1024, 128) == [(0, 0, 300, 200)]
+
+
+def test_only_boxes_at_inner_tile_edges_are_clipped():
+    boxes = np.array([[60, 20, 120, 60], [10, 10, 40, 40], [0, 0, 50, 100]], dtype=np.float32)
+    assert clipped_boxes(boxes, LEFT, FRAME).tolist() == [True, False, False]
+    assert not clipped_boxes(boxes, (0, 0, 200, 100), FRAME).any()
+
+
+def test_single_view_is_returned_unchanged():
+    detection = tile_detection((0, 0, 200, 100), [((10, 10, 50, 50), 1, 0.9)])
+    masks, boxes, labels = merge_detections([detection])
+    assert masks is detection[0] and boxes is detection[1] and labels is detection[2]
+
+
+def test_object_cut_by_a_tile_border_is_merged():
+    obj = (60, 20, 140, 60)
+    masks, boxes, labels = merge_detections([tile_detection(LEFT, [(obj, 3, 0.9)]),
+                                             tile_detection(RIGHT, [(obj, 3, 0.8)])])
+    assert len(masks) == 1
+    assert np.array_equal(masks[0].decode(), box_mask(*obj).decode())
+    assert boxes.tolist() == [list(obj)]
+    assert labels.tolist() == [3]
+
+
+def test_object_inside_the_overlap_is_kept_once():
+    obj = (85, 30, 110, 70)
+    masks, boxes, labels = merge_detections([tile_detection(LEFT, [(obj, 1, 0.7)]),
+                                             tile_detection(RIGHT, [(obj, 1, 0.95)])])
+    assert len(masks) == 1 and boxes.tolist() == [list(obj)]
+
+
+def test_different_labels_are_not_merged():
+    obj = (60, 20, 140, 60)
+    masks, boxes, labels = merge_detections([tile_detection(LEFT, [(obj, 1, 0.9)]),
+                                             tile_detection(RIGHT, [(obj, 2, 0.8)])])
+    assert len(masks) == 2
+    assert sorted(labels.tolist()) == [1, 2]
+
+
+def test_separate_objects_are_not_merged():
+    masks, boxes, labels = merge_detections([tile_detection(LEFT, [((10, 10, 40, 40), 1, 0.9)]),
+                                             tile_detection(RIGHT, [((150, 10, 190, 40), 1, 0.9)])])
+    assert len(masks) == 2
+    assert boxes.shape == (2, 4) and labels.dtype == np.int64
+
+
+def test_disagreeing_masks_in_the_overlap_are_not_merged():
+    # Same label and overlapping boxes, but within the shared region one mask is a top band and the other a
+    # bottom band that touch only in a corner
+    top = np.zeros((40, 60), dtype=bool)
+    top[:5] = True
+    top[:, :25] = True
+    bottom = np.zeros((40, 60), dtype=bool)
+    bottom[35:] = True
+    boxes = np.array([[60, 20, 120, 60]], dtype=np.float32)
+    left = ([CompactMask.from_crop(top, (60, 20), FRAME)], boxes, np.array([1]), np.array([0.9]), np.array([True]))
+    right = ([CompactMask.from_crop(bottom, (80, 20), FRAME)], boxes + [20, 0, 20, 0], np.array([1]),
+             np.array([0.8]), np.array([True]))
+    masks, _, _ = merge_detections([left, right], merge_threshold=0.5)
+    assert len(masks) == 2
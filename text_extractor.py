@@ -1,47 +1,228 @@
 import os
 import json
-import easyocr
 import re
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from result_cache import MISSING
+from model_store import easyocr_dir
+from instrumentation import instrument
+
+# Reader owned by each OCR worker process, created once by init_ocr_worker
+_worker_reader = None
+
+
+# EasyOCR reader that loads its weights from the local artefact directory and never downloads
+def load_reader(languages, artefact_dir=None, gpu=True):
+    import easyocr
+    directory = easyocr_dir(artefact_dir)
+    return easyocr.Reader(list(languages), gpu=gpu, model_storage_directory=directory,
+                          user_network_directory=directory, download_enabled=False)
+
+
+def init_ocr_worker(languages, artefact_dir=None):
+    global _worker_reader
+    import torch
+    torch.set_num_threads(1)  # One core per worker process; the pool provides the parallelism
+    _worker_reader = load_reader(languages, artefact_dir, gpu=False)
+
+
+def ocr_worker(image_input):
+    result = _worker_reader.readtext(image_input)
+    return ' '.join([res[1] for res in result])
+
+
+def clean_text(text):
+    # Remove unwanted characters (e.g., brackets, special characters)
+    cleaned_text = re.sub(r'[^\w\s]', '', text)  # Keep only alphanumeric characters and spaces
+    return cleaned_text.strip()  # Remove leading/trailing whitespace
+
+
 class TextExtractor:
-    def __init__(self, ocr_tool='easyocr'):
-        if ocr_tool == 'easyocr':
-            self.reader = easyocr.Reader(['en'])  # Load English OCR model
-        else:
+    def __init__(self, ocr_tool='easyocr', languages=('en',), mode='sequential', workers=None, batch_size=8, size_bucket=32,
+                 cache=None, reader=None, prefilter=None, artefact_dir=None):
+        if ocr_tool != 'easyocr':
             raise ValueError("Currently only EasyOCR is supported.")
+        if mode not in ('sequential', 'parallel', 'batched'):
+            raise ValueError(f"Unknown OCR mode '{mode}'; expected 'sequential', 'parallel' or 'batched'.")
+
+        self.languages = list(languages)
+        self.artefact_dir = artefact_dir
+        # Load the OCR model (English by default) from the local artefact directory
+        self.reader = reader if reader is not None else load_reader(self.languages, artefact_dir)
+        self.mode = mode
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.size_bucket = size_bucket
+        self.pool = None
+        self.cache = cache  # Optional ResultCache keyed by crop content, OCR languages and mode
+        # Optional TextPresenceFilter; crops it rejects get empty text without running OCR
+        self.prefilter = prefilter
+        self.last_stats = {}
 
-    def extract_text(self, image_path):
-        # Perform OCR on the given image
-        result = self.reader.readtext(image_path)
+    def extract_text(self, image_input):
+        # Perform OCR on the given image (a file path, a PIL image or a NumPy array)
+        key = self.cache_key(image_input, mode='sequential')
+        cached = self.cache.get(key) if key else MISSING
+        if cached is not MISSING:
+            return cached
+
+        text = self.ocr(image_input)
+        if key:
+            self.cache.set(key, text)
+        return text
+
+    def ocr(self, image_input):
+        result = self.reader.readtext(self.to_array(image_input))
         extracted_text = ' '.join([res[1] for res in result])  # Extract the text
         return self.clean_text(extracted_text)  # Clean the extracted text
 
+    # Batched mode reads crops padded to their batch's size, so its results are keyed apart from the other modes
+    def cache_key(self, image_input, mode=None):
+        if self.cache is None:
+            return None
+        mode = mode or self.mode
+        settings = {'tool': 'easyocr', 'languages': self.languages, 'mode': mode}
+        if mode == 'batched':
+            settings.update(batch_size=self.batch_size, size_bucket=self.size_bucket)
+        return self.cache.make_key('ocr', image_input, settings)
+
     def clean_text(self, text):
-        # Remove unwanted characters (e.g., brackets, special characters)
-        cleaned_text = re.sub(r'[^\w\s]', '', text)  # Keep only alphanumeric characters and spaces
-        return cleaned_text.strip()  # Remove leading/trailing whitespace
+        return clean_text(text)
+
+    def to_array(self, image_input):
+        if isinstance(image_input, Image.Image):
+            return np.asarray(image_input.convert('RGB'))
+        return image_input
 
+    @instrument('extract_from_objects', objects=len)
     def extract_from_objects(self, identified_objects):
-        extracted_data = []
+        jobs = list(self.load_jobs(identified_objects))
+        texts, self.last_stats = self.read_jobs(jobs, report=True)
+        return [
+            {'id': obj_id, 'file_path': file_path, 'extracted_text': text}
+            for (obj_id, file_path, _), text in zip(jobs, texts)
+        ]
 
+    # Streaming variant of extract_from_objects for any iterable of objects: reads chunk_size objects at a time
+    # (batch_size by default) and yields their records, in input order, as soon as the chunk has been read.
+    # last_stats covers every chunk so far and is reported once the objects run out.
+    @instrument('iter_extract_from_objects')
+    def iter_extract_from_objects(self, identified_objects, chunk_size=None):
+        chunk_size = chunk_size or self.batch_size
+        self.last_stats = {'objects': 0, 'cached': 0, 'skipped_no_text': 0, 'ocr': 0}
+        jobs = []
+        for job in self.load_jobs(identified_objects):
+            jobs.append(job)
+            if len(jobs) == chunk_size:
+                yield from self.read_chunk(jobs)
+                jobs = []
+        if jobs:
+            yield from self.read_chunk(jobs)
+        print(f"Extracted text from {self.last_stats['ocr']} objects ({self.mode} mode, "
+              f"{self.last_stats['cached']} cached, {self.last_stats['skipped_no_text']} skipped as text-free).")
+
+    def read_chunk(self, jobs):
+        texts, stats = self.read_jobs(jobs)
+        for key, value in stats.items():
+            self.last_stats[key] += value
+        for (obj_id, file_path, _), text in zip(jobs, texts):
+            yield {'id': obj_id, 'file_path': file_path, 'extracted_text': text}
+
+    # OCR input for each object, keeping the incoming order
+    def load_jobs(self, identified_objects):
         for obj in identified_objects:
             obj_id = obj['id']
-            file_path = obj['file_path']
-            
-            if os.path.exists(file_path):
-                print(f"Extracting text from object {obj_id} at {file_path}...")
-                
-                # Extract text from the object image
-                text = self.extract_text(file_path)
-                
-                extracted_data.append({
-                    'id': obj_id,
-                    'file_path': file_path,
-                    'extracted_text': text
-                })
+            file_path = obj.get('file_path')
+            image = obj.get('image')
+
+            if image is not None or (file_path and os.path.exists(file_path)):
+                # Use the in-memory crop when there is one, otherwise the file
+                yield obj_id, file_path, image if image is not None else file_path
             else:
                 print(f"Error: File {file_path} does not exist.")
-        
-        return extracted_data
+
+    # Text for each (id, file path, image input) job, and counts of how each text was obtained.
+    # Only crops missing from the cache and passing the text-presence prefilter go through OCR.
+    def read_jobs(self, jobs, report=False):
+        texts = [None] * len(jobs)
+        keys = [self.cache_key(image_input) for _, _, image_input in jobs]
+        pending = []
+        skipped = 0
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key) if key else MISSING
+            if cached is not MISSING:
+                texts[i] = cached
+            elif self.prefilter is not None and not self.prefilter.has_text(jobs[i][2]):
+                texts[i] = ''
+                skipped += 1
+            else:
+                pending.append(i)
+
+        stats = {'objects': len(jobs), 'cached': len(jobs) - len(pending) - skipped, 'skipped_no_text': skipped,
+                 'ocr': len(pending)}
+        if report:
+            print(f"Extracting text from {len(pending)} objects ({self.mode} mode, "
+                  f"{stats['cached']} cached, {skipped} skipped as text-free)...")
+        inputs = [jobs[i][2] for i in pending]
+        if self.mode == 'parallel':
+            new_texts = self.extract_parallel(inputs)
+        elif self.mode == 'batched':
+            new_texts = self.extract_batched(inputs)
+        else:
+            new_texts = [self.ocr(image_input) for image_input in inputs]
+
+        for i, text in zip(pending, new_texts):
+            texts[i] = text
+            if keys[i]:
+                self.cache.set(keys[i], text)
+        return texts, stats
+
+    # OCR crops on a pool of worker processes, each holding its own EasyOCR reader
+    def extract_parallel(self, inputs):
+        if not inputs:
+            return []
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_ocr_worker,
+                                            initargs=(self.languages, self.artefact_dir))
+        arrays = [self.to_array(image_input) for image_input in inputs]
+        chunksize = max(1, len(arrays) // (self.workers * 4))
+        return [self.clean_text(text) for text in self.pool.map(ocr_worker, arrays, chunksize=chunksize)]
+
+    # OCR crops of similar size together with EasyOCR's batched recognition
+    def extract_batched(self, inputs):
+        arrays = [np.asarray(Image.open(i).convert('RGB')) if isinstance(i, str) else self.to_array(i) for i in inputs]
+
+        # Bucket crops by rounded size so padding each batch to a common shape stays small
+        buckets = {}
+        for index, array in enumerate(arrays):
+            key = (-(-array.shape[0] // self.size_bucket), -(-array.shape[1] // self.size_bucket))
+            buckets.setdefault(key, []).append(index)
+
+        texts = [''] * len(arrays)
+        for indices in buckets.values():
+            for start in range(0, len(indices), self.batch_size):
+                batch = indices[start:start + self.batch_size]
+                height = max(arrays[i].shape[0] for i in batch)
+                width = max(arrays[i].shape[1] for i in batch)
+
+                # Pad by repeating the border so the padding doesn't introduce false edges
+                padded = [self.pad_to(arrays[i], height, width) for i in batch]
+                results = self.reader.readtext_batched(padded)
+                for i, result in zip(batch, results):
+                    texts[i] = self.clean_text(' '.join([res[1] for res in result]))
+
+        return texts
+
+    def pad_to(self, array, height, width):
+        padding = ((0, height - array.shape[0]), (0, width - array.shape[1])) + ((0, 0),) * (array.ndim - 2)
+        return np.pad(array, padding, mode='edge')
+
+    # Shut down the OCR worker pool, if one was started
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
 
     def save_extracted_text(self, extracted_data, output_file='extracted_text.json'):
         # Save extracted text to a JSON file
@@ -0,0 +1,51 @@
+import numpy as np
+from PIL import Image
+
+
+class TextPresenceFilter:
+    # Cheap test for whether a crop can contain text, run before full OCR.
+    # Text shows up as dense, high-contrast strokes. A word usually covers a small part of its crop, so the
+    # edge density is measured in window_size squares and the densest one counts; crops that are too small or
+    # have no window with enough sharp edges are treated as text-free. Rendered text scores 0.2 or more at the
+    # default sizes while flat, gradient and blurred crops score near 0, so the default threshold keeps a wide
+    # margin for recall. Lowering min_edge_density raises recall at the cost of sending more crops to OCR.
+    def __init__(self, min_size=12, min_edge_density=0.08, edge_threshold=40, analysis_size=256, window_size=16):
+        self.min_size = min_size
+        self.min_edge_density = min_edge_density
+        self.edge_threshold = edge_threshold
+        self.analysis_size = analysis_size
+        self.window_size = window_size
+
+    def to_gray(self, image_input):
+        if isinstance(image_input, str):
+            image_input = Image.open(image_input)
+        if isinstance(image_input, np.ndarray):
+            image_input = Image.fromarray(image_input)
+        gray = image_input.convert('L')
+
+        # Analyse at a bounded size so the cost doesn't grow with the crop
+        if max(gray.size) > self.analysis_size:
+            scale = self.analysis_size / max(gray.size)
+            gray = gray.resize((max(1, round(gray.width * scale)), max(1, round(gray.height * scale))), Image.BILINEAR)
+        return image_input.size, np.asarray(gray, dtype=np.int16)
+
+    # Fraction of pixels on a strong horizontal or vertical intensity step, in the densest window_size square
+    def edge_density(self, gray):
+        if gray.shape[0] < 2 or gray.shape[1] < 2:
+            return 0.0
+        horizontal = np.abs(np.diff(gray, axis=1))[:-1, :] > self.edge_threshold
+        vertical = np.abs(np.diff(gray, axis=0))[:, :-1] > self.edge_threshold
+        edges = (horizontal | vertical).astype(np.int32)
+
+        # Edge count of every window from a summed-area table
+        window = min(self.window_size, *edges.shape)
+        table = np.pad(edges.cumsum(axis=0).cumsum(axis=1), ((1, 0), (1, 0)))
+        counts = (table[window:, window:] - table[:-window, window:] - table[window:, :-window]
+                  + table[:-window, :-window])
+        return float(counts.max()) / (window * window)
+
+    def has_text(self, image_input):
+        (width, height), gray = self.to_gray(image_input)
+        if min(width, height) < self.min_size:
+            return False
+        return self.edge_density(gray) >= self.min_edge_density
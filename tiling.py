@@ -0,0 +1,73 @@
+import numpy as np
+
+
+# Tiles of at most tile_size covering the frame, each overlapping its neighbours by at least tile_overlap
+def tile_regions(width, height, tile_size, tile_overlap):
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = tile_size - tile_overlap
+        return list(range(0, length - tile_size, step)) + [length - tile_size]
+
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+# Which boxes end at an edge of their tile that lies inside the frame, i.e. may continue in a neighbouring tile
+def clipped_boxes(boxes, region, frame_shape, margin=2):
+    x1, y1, x2, y2 = region
+    height, width = frame_shape
+    clipped = np.zeros(len(boxes), dtype=bool)
+    if x1 > 0:
+        clipped |= boxes[:, 0] <= x1 + margin
+    if y1 > 0:
+        clipped |= boxes[:, 1] <= y1 + margin
+    if x2 < width:
+        clipped |= boxes[:, 2] >= x2 - margin
+    if y2 < height:
+        clipped |= boxes[:, 3] >= y2 - margin
+    return clipped
+
+
+# Combine the detections (masks, boxes, labels, scores, clipped) of every model input of one image. Detections
+# from overlapping tiles with the same label are merged when their masks agree: on most of the smaller mask for
+# whole objects, or within the shared box region for objects cut by a tile border. Higher-scoring detections
+# absorb lower-scoring ones.
+def merge_detections(detections, merge_threshold=0.5):
+    if len(detections) == 1:
+        masks, boxes, labels, _, _ = detections[0]
+        return masks, boxes, labels
+
+    candidates = [(score, mask, box, label, clipped)
+                  for masks, boxes, labels, scores, clipped_flags in detections
+                  for mask, box, label, score, clipped in zip(masks, boxes, labels, scores, clipped_flags)]
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    kept = []  # [mask, box, label, clipped]
+    for _, mask, box, label, clipped in candidates:
+        for entry in kept:
+            if entry[2] == label and same_object(entry[0], entry[3], mask, clipped, merge_threshold):
+                entry[0] = entry[0].union(mask)
+                entry[1] = np.concatenate([np.minimum(entry[1][:2], box[:2]), np.maximum(entry[1][2:], box[2:])])
+                entry[3] = entry[3] or clipped
+                break
+        else:
+            kept.append([mask, box, label, clipped])
+
+    masks = [entry[0] for entry in kept]
+    boxes = np.array([entry[1] for entry in kept], dtype=np.float32).reshape(-1, 4)
+    labels = np.array([entry[2] for entry in kept], dtype=np.int64)
+    return masks, boxes, labels
+
+
+def same_object(mask, mask_clipped, other, other_clipped, merge_threshold=0.5):
+    intersection = mask.intersection(other)
+    if intersection == 0:
+        return False
+    if mask_clipped or other_clipped:
+        # Only the shared region is seen by both tiles, so compare the masks there
+        region = (max(mask.box[0], other.box[0]), max(mask.box[1], other.box[1]),
+                  min(mask.box[2], other.box[2]), min(mask.box[3], other.box[3]))
+        union = np.logical_or(mask.crop_region(region), other.crop_region(region)).sum()
+        return intersection / union >= merge_threshold
+    return intersection / min(mask.area, other.area) >= merge_threshold